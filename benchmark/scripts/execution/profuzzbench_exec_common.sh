@@ -13,12 +13,27 @@ DELETE=$9
 
 WORKDIR="/home/ubuntu/experiments"
 
+#share an LLM response cache between all containers (and campaigns) if LLM_CACHE is set
+DOCKER_OPTS=""
+if [ ! -z $LLM_CACHE ]; then
+  mkdir -p $LLM_CACHE
+  DOCKER_OPTS+=" -v $(realpath $LLM_CACHE):/home/ubuntu/llm_cache -e STELLAFUZZ_CACHE_DIR=/home/ubuntu/llm_cache"
+fi
+
+#generate the stellafuzz seeds once per subject if STELLAFUZZ_PREGEN is set, and let every container copy them instead of
+#running the LLM pipeline again; each run samples STELLAFUZZ_SAMPLE_RATE of the seeds with its run number as random seed
+if [ ! -z $STELLAFUZZ_PREGEN ] && [ $FUZZER = "stellafuzz" ]; then
+  profuzzbench_pregen_stellafuzz.sh $DOCIMAGE $STELLAFUZZ_PREGEN || exit 1
+  DOCKER_OPTS+=" -v $(realpath $STELLAFUZZ_PREGEN/$DOCIMAGE):/home/ubuntu/stellafuzz_pregen:ro -e STELLAFUZZ_PREGEN_DIR=/home/ubuntu/stellafuzz_pregen"
+  DOCKER_OPTS+=" -e STELLAFUZZ_SAMPLE_RATE=${STELLAFUZZ_SAMPLE_RATE:-1}"
+fi
+
 #keep all container ids
 cids=()
 
 #create one container for each run
 for i in $(seq 1 $RUNS); do
-  id=$(docker run --cpus=1 -d -it $DOCIMAGE /bin/bash -c "cd ${WORKDIR} && run ${FUZZER} ${OUTDIR} '${OPTIONS}' ${TIMEOUT} ${SKIPCOUNT}")
+  id=$(docker run --cpus=1 -d -it $DOCKER_OPTS -e STELLAFUZZ_SAMPLE_SEED=$i $DOCIMAGE /bin/bash -c "cd ${WORKDIR} && run ${FUZZER} ${OUTDIR} '${OPTIONS}' ${TIMEOUT} ${SKIPCOUNT}")
   cids+=(${id::12}) #store only the first 12 characters of a container ID
 done
 
@@ -0,0 +1,45 @@
+#!/bin/bash
+
+DOCIMAGE=$1   #name of the docker image
+SAVETO=$2     #path to folder keeping the pre-generated corpora, one sub-folder per docker image
+OPTIONS=$3    #additional options for stellafuzz.py (e.g., "-j 16")
+
+WORKDIR="/home/ubuntu/experiments"
+PREGEN="/home/ubuntu/stellafuzz_pregen"
+
+#Run the stellafuzz pipeline once for a subject and save the generated seeds (corpus/) and llm_outputs/ to ${SAVETO}/${DOCIMAGE}.
+#profuzzbench_exec_common.sh calls this script when STELLAFUZZ_PREGEN is set and mounts the result into every stellafuzz container,
+#whose run.sh then copies (a seeded sample of) the corpus instead of running the pipeline again.
+if [ -d ${SAVETO}/${DOCIMAGE} ]; then
+  printf "\nSTELLAFUZZ: Using the pre-generated corpus in ${SAVETO}/${DOCIMAGE}\n"
+  exit 0
+fi
+
+#share an LLM response cache between all containers (and campaigns) if LLM_CACHE is set
+DOCKER_OPTS=""
+if [ ! -z $LLM_CACHE ]; then
+  mkdir -p $LLM_CACHE
+  DOCKER_OPTS+=" -v $(realpath $LLM_CACHE):/home/ubuntu/llm_cache -e STELLAFUZZ_CACHE_DIR=/home/ubuntu/llm_cache"
+fi
+
+mkdir -p ${SAVETO}
+id=$(docker run -d -it $DOCKER_OPTS $DOCIMAGE /bin/bash -c "cd ${WORKDIR} && run stellafuzz-pregen ${PREGEN} '${OPTIONS}'")
+printf "\nSTELLAFUZZ: Generating the corpus of ${DOCIMAGE} in container ${id::12}"
+STATUS=$(docker wait ${id})
+
+docker cp ${id}:${PREGEN} ${SAVETO}/${DOCIMAGE} > /dev/null
+docker rm ${id} > /dev/null
+#stellafuzz.py exits non-zero when a stage failed or finished with failed LLM calls; such a partial corpus would be
+#reused by every container of the campaign, so it is moved aside to ${DOCIMAGE}.incomplete instead of being used.
+#ls leaves out dot files such as temporary files, so a corpus without seeds counts as a failure too
+if [ "$STATUS" != "0" ] || [ -z "$(ls ${SAVETO}/${DOCIMAGE}/corpus 2>/dev/null)" ]; then
+  printf "\nSTELLAFUZZ: Generating the corpus of ${DOCIMAGE} failed or is incomplete (exit status ${STATUS})\n"
+  rm -rf ${SAVETO}/${DOCIMAGE}.incomplete
+  if [ -d ${SAVETO}/${DOCIMAGE} ]; then
+    mv ${SAVETO}/${DOCIMAGE} ${SAVETO}/${DOCIMAGE}.incomplete
+    printf "STELLAFUZZ: Kept its output in ${SAVETO}/${DOCIMAGE}.incomplete; it is not used for fuzzing\n"
+  fi
+  exit 1
+fi
+
+printf "\nSTELLAFUZZ: Saved $(ls ${SAVETO}/${DOCIMAGE}/corpus | wc -l) seeds and the llm_outputs of ${DOCIMAGE} to ${SAVETO}/${DOCIMAGE}\n"
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+
+# Runs stellafuzz.py of a subject end to end against the mock LLM server
+# (stellafuzz_mock_llm.py) at several concurrency levels and reports the wall
+# time and request throughput of each run.
+#
+# Example:
+#   stellafuzz_bench_pipeline.py -S ../../subjects/FTP/LightFTP -p FTP -j 1 4 16 --latency 0.5
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+import subprocess
+import urllib.request
+
+from stellafuzz_mock_llm import build_parser as mock_parser, serve
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SUBJECT = os.path.join(SCRIPT_DIR, "..", "..", "subjects", "FTP", "LightFTP")
+
+def mock_stats(url: str) -> dict:
+  with urllib.request.urlopen(f"{url}/stats") as response:
+    return json.load(response)
+
+def run_pipeline(args, url: str, jobs: int) -> dict:
+  subject = os.path.abspath(args.subject)
+  seeds = os.path.abspath(args.seeds) if args.seeds else None
+  workdir = tempfile.mkdtemp(prefix=f"stellafuzz-bench-j{jobs}-")
+  env = dict(os.environ,
+             OPENAI_BASE_URL=f"{url}/v1",
+             OPENAI_API_KEY="mock",
+             STELLAFUZZ_LLM_RPM=str(args.rpm),
+             STELLAFUZZ_LLM_TPM=str(args.tpm))
+  command = [sys.executable, os.path.join(subject, "stellafuzz.py"), "-p", args.protocol, "-o", "out", "-j", str(jobs)]
+  if seeds:
+    command += ["-s", seeds]
+
+  before = mock_stats(url)["counts"]
+  start = time.time()
+  result = subprocess.run(command, cwd=workdir, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+  wall = time.time() - start
+  after = mock_stats(url)["counts"]
+
+  requests = {status: after.get(status, 0) - before.get(status, 0) for status in after}
+  out_dir = os.path.join(workdir, "out")
+  # Dot files, e.g. temporary files of the corpus writer, are not seeds.
+  seeds_written = len([name for name in os.listdir(out_dir) if not name.startswith(".")]) if os.path.isdir(out_dir) else 0
+  if args.keep:
+    print(f"Kept working directory {workdir}")
+  else:
+    shutil.rmtree(workdir, ignore_errors=True)
+  if result.returncode != 0:
+    print(result.stdout)
+
+  completed = requests.get("200", 0)
+  return {
+    "jobs": jobs,
+    "wall_time": wall,
+    "requests": requests,
+    "requests_per_second": completed / wall if wall > 0 else 0.0,
+    "seeds": seeds_written,
+    "seeds_per_second": seeds_written / wall if wall > 0 else 0.0,
+    "returncode": result.returncode,
+  }
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description="Benchmark stellafuzz.py against the mock LLM at several concurrency levels",
+                                   parents=[mock_parser(add_help=False)], conflict_handler='resolve')
+  parser.add_argument('-S','--subject',type=str,default=DEFAULT_SUBJECT,help="Subject folder containing stellafuzz.py")
+  parser.add_argument('-p','--protocol',type=str,default="FTP")
+  parser.add_argument('-s','--seeds',type=str,default=None,help="Seed message folder passed to stellafuzz.py")
+  parser.add_argument('-j','--jobs',type=int,nargs='+',default=[1, 2, 4, 8, 16],help="Concurrency levels to measure")
+  parser.add_argument('-r','--repeat',type=int,default=1,help="Runs per concurrency level")
+  parser.add_argument('--rpm',type=int,default=0,help="Client-side requests-per-minute limit (0: unlimited)")
+  parser.add_argument('--tpm',type=int,default=0,help="Client-side tokens-per-minute limit (0: unlimited)")
+  parser.add_argument('--port',type=int,default=0,help="Port of the mock server (0: any free port)")
+  parser.add_argument('-o','--out_file',type=str,default=None,help="Write the results as JSON to this file")
+  parser.add_argument('--keep',action='store_true',help="Keep the working directories of the runs")
+  args = parser.parse_args()
+
+  server = serve(args)
+  threading.Thread(target=server.serve_forever, daemon=True).start()
+  url = f"http://{args.host}:{server.server_address[1]}"
+
+  results = []
+  print(f"{'jobs':>5} {'wall (s)':>10} {'req/s':>8} {'seeds':>6} {'429':>5} {'500':>5}")
+  for jobs in args.jobs:
+    for _ in range(args.repeat):
+      result = run_pipeline(args, url, jobs)
+      results.append(result)
+      requests = result["requests"]
+      print(f"{jobs:>5} {result['wall_time']:>10.2f} {result['requests_per_second']:>8.2f} {result['seeds']:>6} "
+            f"{requests.get('429', 0):>5} {requests.get('500', 0):>5}", flush=True)
+  server.shutdown()
+
+  if args.out_file:
+    with open(args.out_file, "w") as f:
+      json.dump({"protocol": args.protocol, "subject": os.path.abspath(args.subject), "latency": args.latency,
+                 "latency_dist": args.latency_dist, "results": results}, f, indent=2)
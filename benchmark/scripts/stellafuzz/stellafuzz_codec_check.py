@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+
+# Checks that the 0xHH seed codec of a subject (utility/codec.py) is lossless
+# and measures its throughput.
+#
+# The round-trip property decode(encode(data)) == data is checked on random
+# byte strings, half of them drawn from an alphabet of bytes that make the
+# notation ambiguous ("0", "x", hex digits, spaces, NUL, ...). The benchmark
+# then encodes and decodes multi-megabyte binary, text and mixed seeds, and
+# decodes a binary message written the way the LLM writes it. Text in which
+# "0x" is part of a word must decode unchanged (DECODE_CASES).
+#
+# Example:
+#   stellafuzz_codec_check.py -S ../../subjects/TLS/OpenSSL -n 100000 --size 4
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SUBJECT = os.path.join(SCRIPT_DIR, "..", "..", "subjects", "FTP", "LightFTP")
+
+TRICKY_ALPHABET = [b"0", b"x", b"a", b"F", b"1", b"9", b"g", b" ", b"  ", b"\x00", b"\xff", b"\r\n", b"\t", b"0x", b" 0x"]
+
+# Text as the LLM writes it, and the bytes it stands for.
+DECODE_CASES = [
+  ("STOR 0xfile", b"STOR 0xfile"),
+  ("X-Id: 0xdeadbeef", b"X-Id: 0xdeadbeef"),
+  ("MAIL FROM:<a@b> SIZE=0x10", b"MAIL FROM:<a@b> SIZE=0x10"),
+  ("USER 0x1a", b"USER\x1a"),
+  ("0x1a 0x0b", b"\x1a\x0b"),
+  ("0x000x01", b"\x00\x01"),
+  ("0x1 0x2", b"\x01\x02"),
+  ("a0x1 b", b"a0x1 b"),
+]
+
+def check_decode_cases(codec) -> list:
+  failures = []
+  for text, expected in DECODE_CASES:
+    decoded = codec.decode(text)
+    if decoded != expected:
+      failures.append({"text": text, "expected": expected.hex(), "decoded": decoded.hex()})
+  return failures
+
+def random_bytes(rng: random.Random, tricky: bool, max_length: int) -> bytes:
+  length = rng.randint(0, max_length)
+  if tricky:
+    return b"".join(rng.choice(TRICKY_ALPHABET) for _ in range(length))
+  return bytes(rng.randrange(256) for _ in range(length))
+
+def check_round_trip(codec, iterations: int, max_length: int, seed: int) -> list:
+  rng = random.Random(seed)
+  failures = []
+  for i in range(iterations):
+    data = random_bytes(rng, i % 2 == 1, max_length)
+    encoded = codec.encode(data)
+    decoded = codec.decode(encoded)
+    if decoded != data:
+      failures.append({"data": data.hex(), "encoded": encoded, "decoded": decoded.hex()})
+      if len(failures) >= 10:
+        break
+  return failures
+
+def corpus(size: int, seed: int) -> dict:
+  rng = random.Random(seed)
+  binary = rng.randbytes(size)
+  text = (b"USER anonymous\r\nPASS ftp@example.com\r\nLIST -la 0x\r\n" * (size // 48 + 1))[:size]
+  mixed = b"".join(rng.randbytes(64) + b"GET /index.html HTTP/1.1\r\n" for _ in range(size // 90 + 1))[:size]
+  return {"binary": binary, "text": text, "mixed": mixed}
+
+def timed(func, *args, repeat: int = 3):
+  best = None
+  for _ in range(repeat):
+    start = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - start
+    best = elapsed if best is None else min(best, elapsed)
+  return result, best
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description="Round-trip check and micro-benchmark of the 0xHH seed codec")
+  parser.add_argument('-S','--subject',type=str,default=DEFAULT_SUBJECT,help="Subject folder containing utility/codec.py")
+  parser.add_argument('-n','--iterations',type=int,default=20000,help="Random inputs for the round-trip check")
+  parser.add_argument('--max_length',type=int,default=40,help="Maximum length of a random input")
+  parser.add_argument('--size',type=float,default=4,help="Size of the benchmark seeds in MiB")
+  parser.add_argument('--seed',type=int,default=0,help="Random seed")
+  parser.add_argument('-o','--out_file',type=str,default=None,help="Write the results as JSON to this file")
+  args = parser.parse_args()
+
+  sys.path.insert(0, os.path.abspath(args.subject))
+  from utility import codec
+
+  failures = check_round_trip(codec, args.iterations, args.max_length, args.seed)
+  print(f"Round trip: {args.iterations - len(failures) if not failures else 'FAILED'} of {args.iterations} inputs")
+  for failure in failures:
+    print(f"  {failure}")
+
+  case_failures = check_decode_cases(codec)
+  print(f"Decode cases: {len(DECODE_CASES) - len(case_failures)} of {len(DECODE_CASES)} decoded as expected")
+  for failure in case_failures:
+    print(f"  {failure}")
+
+  results = {"round_trip": {"iterations": args.iterations, "failures": failures}, "decode_cases": {"cases": len(DECODE_CASES), "failures": case_failures},
+             "benchmark": {}}
+  size = int(args.size * 1024 * 1024)
+  print(f"{'seed':>8} {'encode (ms)':>12} {'decode (ms)':>12} {'MiB/s enc':>10} {'MiB/s dec':>10} {'lossless':>9}")
+  for name, data in corpus(size, args.seed).items():
+    encoded, encode_time = timed(codec.encode, data)
+    decoded, decode_time = timed(codec.decode, encoded)
+    mib = len(data) / (1024 * 1024)
+    results["benchmark"][name] = {"bytes": len(data), "encoded_chars": len(encoded), "encode_seconds": encode_time,
+                                  "decode_seconds": decode_time, "lossless": decoded == data}
+    print(f"{name:>8} {encode_time * 1000:>12.1f} {decode_time * 1000:>12.1f} {mib / encode_time:>10.1f} "
+          f"{mib / decode_time:>10.1f} {str(decoded == data):>9}")
+
+  # Binary messages as the LLM writes them: nothing but space separated escapes.
+  data = random.Random(args.seed).randbytes(size)
+  llm_text = " ".join(f"0x{byte:02x}" for byte in data)
+  decoded, decode_time = timed(codec.decode, llm_text)
+  mib = len(data) / (1024 * 1024)
+  results["benchmark"]["llm"] = {"bytes": len(data), "encoded_chars": len(llm_text), "encode_seconds": None,
+                                 "decode_seconds": decode_time, "lossless": decoded == data}
+  print(f"{'llm':>8} {'-':>12} {decode_time * 1000:>12.1f} {'-':>10} {mib / decode_time:>10.1f} {str(decoded == data):>9}")
+
+  if args.out_file:
+    with open(args.out_file, "w") as f:
+      json.dump(results, f, indent=2)
+  sys.exit(1 if failures or case_failures or not all(result["lossless"] for result in results["benchmark"].values()) else 0)
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+
+# Counts how many generated seeds aflnet splits back into the messages they
+# were made of, with the old framing (CRLF after every message) and with the
+# protocol-aware framing of utility/framing.py.
+#
+# The seeds are rebuilt from the test case results in an llm_outputs
+# directory (4_<protocol>_testcases_N.json[.zst]), so runs made before the
+# framing change can be compared as well. A seed matches if the port of aflnet's
+# extract_requests_* function for the protocol returns exactly one region per
+# message.
+#
+# Example:
+#   stellafuzz_framing_report.py -S ../../subjects/TLS/OpenSSL -p TLS -r ../../subjects/TLS/OpenSSL/llm_outputs
+
+import os
+import re
+import sys
+import glob
+import json
+import argparse
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SUBJECT = os.path.join(SCRIPT_DIR, "..", "..", "subjects", "FTP", "LightFTP")
+
+def load_test_cases(artifacts, results_dir: str, protocol: str) -> dict:
+  test_cases = {}
+  pattern = re.compile(rf"4_{re.escape(protocol.lower())}_testcases_(\d+)\.json(\.zst)?")
+  for file_path in sorted(glob.glob(os.path.join(results_dir, "4_*_testcases_*.json*"))):
+    if not pattern.fullmatch(os.path.basename(file_path)):
+      continue
+    for test_case_id, test_case in artifacts.load_artifact(file_path).items():
+      test_cases[(os.path.basename(file_path), test_case_id)] = test_case
+  return test_cases
+
+def report(framing, codec, protocol: str, test_cases: dict) -> dict:
+  results = {"protocol": protocol, "test_cases": len(test_cases), "seeds": 0, "legacy": 0, "framed": 0, "mismatches": []}
+  for (file_name, test_case_id), test_case in test_cases.items():
+    for sequence in test_case.get("sequences", []):
+      try:
+        messages = [codec.decode(message["message"]) for message in sequence["messages"]]
+      except Exception:
+        continue
+      results["seeds"] += 1
+      results["legacy"] += bool(framing.framing_matches(protocol, [framing.frame_legacy(message, index) for index, message in enumerate(messages)]))
+      framed = framing.frame_messages(protocol, messages)
+      if framing.framing_matches(protocol, framed):
+        results["framed"] += 1
+      else:
+        results["mismatches"].append({"file": file_name, "test_case": test_case_id, "messages": [len(message) for message in framed],
+                                      "regions": [end - start + 1 for start, end in framing.split_requests(protocol, b"".join(framed))]})
+  return results
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description="Check generated seeds against aflnet's request splitter")
+  parser.add_argument('-S','--subject',type=str,default=DEFAULT_SUBJECT,help="Subject folder containing utility/framing.py")
+  parser.add_argument('-p','--protocol',type=str,required=True,help="Protocol as passed to stellafuzz.py")
+  parser.add_argument('-r','--results_dir',type=str,default="llm_outputs",help="llm_outputs directory of a stellafuzz run")
+  parser.add_argument('-v','--verbose',action='store_true',help="List the seeds that do not match")
+  parser.add_argument('-o','--out_file',type=str,default=None,help="Write the report as JSON to this file")
+  args = parser.parse_args()
+
+  sys.path.insert(0, os.path.abspath(args.subject))
+  from utility import artifacts, codec, framing
+
+  if framing.split_requests(args.protocol, b"") is None:
+    print(f"No aflnet splitter for protocol {args.protocol}")
+    sys.exit(1)
+  test_cases = load_test_cases(artifacts, args.results_dir, args.protocol)
+  if not test_cases:
+    print(f"No {args.protocol} test cases in {args.results_dir}")
+    sys.exit(1)
+
+  results = report(framing, codec, args.protocol, test_cases)
+  seeds = results["seeds"] or 1
+  print(f"{args.protocol}: {results['seeds']} seeds from {results['test_cases']} test cases")
+  print(f"  CRLF framing:           {results['legacy']:>6} match ({100 * results['legacy'] / seeds:.1f}%)")
+  print(f"  protocol-aware framing: {results['framed']:>6} match ({100 * results['framed'] / seeds:.1f}%)")
+  if args.verbose:
+    for mismatch in results["mismatches"]:
+      print(f"  {mismatch}")
+
+  if args.out_file:
+    with open(args.out_file, "w") as f:
+      json.dump(results, f, indent=2)
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+
+# Micro-benchmarks of the local hot paths of the pipeline, without network:
+#
+#   seeds_<size>      load_seed_messages on a folder with one seed of <size>
+#   decode_<size>     convert_message_to_binary of an encoded <size> message
+#   save_messages     save_test_cases of one test case with --messages messages
+#   save_sequences    save_test_cases of --sequences test cases of 10 messages
+#   prompt_testcase   build_test_case_prompt for a sequence of --messages types
+#   prompt_testcases  build_test_case_prompt for --sequences sequences, as get_test_cases does
+#   prompt_sequences  build_message_sequence_prompt and build_repeated_sequence_prompt
+#                     for --sequences message types
+#
+# All inputs are synthetic (see stellafuzz_codec_check.py for the seed data).
+# Every benchmark is repeated up to -n times within a time budget and the best
+# time per call is kept. With -b, the throughput is compared against a report
+# written earlier with -o, and the script exits with status 1 if a benchmark
+# got slower by more than --tolerance percent.
+#
+# Example:
+#   stellafuzz_microbench.py -o microbench.json
+#   stellafuzz_microbench.py --sizes 1K 1M -b microbench.json
+
+import os
+import sys
+import json
+import time
+import shutil
+import random
+import argparse
+import tempfile
+
+from stellafuzz_codec_check import corpus
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SUBJECT = os.path.join(SCRIPT_DIR, "..", "..", "subjects", "FTP", "LightFTP")
+
+UNITS = {"K": 1024, "M": 1024 * 1024}
+FIELDS_PER_TYPE = 8
+TYPE_COUNT = 100
+MIN_MEASUREMENT = 0.05              # Seconds a single measurement should at least take
+
+def parse_size(text: str) -> int:
+  if text[-1].upper() in UNITS:
+    return int(float(text[:-1]) * UNITS[text[-1].upper()])
+  return int(text)
+
+def measure(func, number: int) -> float:
+  start = time.perf_counter()
+  for _ in range(number):
+    func()
+  return time.perf_counter() - start
+
+def timed(func, repeat: int, budget: float) -> float:
+  """Best time per call of up to repeat measurements; stops repeating once
+  budget seconds are used. Like timeit, fast functions are called several
+  times per measurement."""
+  number = 1
+  elapsed = measure(func, number)
+  while elapsed < MIN_MEASUREMENT:
+    number *= 10
+    elapsed = measure(func, number)
+  best = elapsed / number
+  spent = elapsed
+  for _ in range(repeat - 1):
+    if spent >= budget:
+      break
+    elapsed = measure(func, number)
+    best = min(best, elapsed / number)
+    spent += elapsed
+  return best
+
+def message_types(count: int) -> dict:
+  return {"client_to_server_messages": [{"name": f"TYPE_{i}", "code": f"C{i}", "description": f"Message type {i}"} for i in range(count)]}
+
+def specialized_structures(count: int) -> dict:
+  structures = {}
+  for i in range(count):
+    fields = [{"name": f"field_{j}", "fixed_byte_length": 4 if j % 2 else None, "data_type": "bytes" if j % 3 else "string",
+               "description": f"Field {j} of TYPE_{i}", "details": "big-endian length prefix" if j % 4 == 0 else None}
+              for j in range(FIELDS_PER_TYPE)]
+    structures[f"TYPE_{i}"] = {"protocol": "BENCH", "message_type": f"TYPE_{i}", "code": f"C{i}",
+                               "type_description": f"Synthetic message type {i}", "fields": fields}
+  return structures
+
+def test_case(utility, rng: random.Random, sequences: int, messages: int) -> dict:
+  return {"protocol": "FTP", "sequences": [
+    {"sequenceId": str(i), "explanation": "", "messages": [{"message": utility.escape_seed_message(f"STOR f{i}_{j}\r\n".encode() + rng.randbytes(16))}
+                                                             for j in range(messages)]}
+    for i in range(sequences)]}
+
+def run_benchmarks(args, utility, testcases, normal_sequence, repeated_sequence) -> dict:
+  rng = random.Random(args.seed)
+  results = {}
+  workdir = tempfile.mkdtemp(prefix="stellafuzz-microbench-")
+
+  def record(name: str, seconds: float, amount: float, unit: str) -> None:
+    results[name] = {"seconds": seconds, "throughput": amount / seconds, "unit": unit}
+    print(f"{name:>18} {seconds * 1000:>12.2f} {amount / seconds:>14.1f} {unit}", flush=True)
+
+  try:
+    for text in args.sizes:
+      size = parse_size(text)
+      data = corpus(size, args.seed)["mixed"]
+      seed_dir = os.path.join(workdir, f"seeds_{text}")
+      os.makedirs(seed_dir)
+      with open(os.path.join(seed_dir, "seed"), "wb") as f:
+        f.write(data)
+      mib = size / (1024 * 1024)
+      record(f"seeds_{text}", timed(lambda: utility.load_seed_messages(seed_dir), args.repeat, args.budget), mib, "MiB/s")
+      encoded = utility.escape_seed_message(data)
+      record(f"decode_{text}", timed(lambda encoded=encoded: utility.convert_message_to_binary(encoded), args.repeat, args.budget), mib, "MiB/s")
+      del data, encoded
+
+    # Every run writes to a fresh folder, so the writer never skips a seed as a duplicate.
+    runs = iter(range(1000000))
+    large = {"0": test_case(utility, rng, 1, args.messages)}
+    record("save_messages", timed(lambda: utility.save_test_cases(large, os.path.join(workdir, f"save_{next(runs)}"), "seed", protocol="FTP"),
+                                  args.repeat, args.budget), args.messages, "messages/s")
+    many = {str(i): test_case(utility, rng, 1, 10) for i in range(args.sequences)}
+    record("save_sequences", timed(lambda: utility.save_test_cases(many, os.path.join(workdir, f"save_{next(runs)}"), "seed", protocol="FTP"),
+                                   args.repeat, args.budget), args.sequences, "seeds/s")
+
+    structures = specialized_structures(TYPE_COUNT)
+    seed_message = utility.escape_seed_message(corpus(4096, args.seed)["mixed"])
+    long_sequence = [f"TYPE_{rng.randrange(TYPE_COUNT)}" for _ in range(args.messages)]
+    record("prompt_testcase", timed(lambda: testcases.build_test_case_prompt("BENCH", long_sequence, structures, seed_message),
+                                    args.repeat, args.budget), 1, "prompts/s")
+    sequences = [[f"TYPE_{rng.randrange(TYPE_COUNT)}" for _ in range(10)] for _ in range(args.sequences)]
+    record("prompt_testcases", timed(lambda: [testcases.build_test_case_prompt("BENCH", sequence, structures, seed_message) for sequence in sequences],
+                                     args.repeat, args.budget), len(sequences), "prompts/s")
+    types = message_types(args.sequences)
+    record("prompt_sequences", timed(lambda: (normal_sequence.build_message_sequence_prompt("BENCH", types),
+                                              repeated_sequence.build_repeated_sequence_prompt("BENCH", types)),
+                                     args.repeat, args.budget), 2, "prompts/s")
+  finally:
+    shutil.rmtree(workdir, ignore_errors=True)
+  return results
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description="Micro-benchmarks of seed loading, decoding, corpus writing and prompt assembly")
+  parser.add_argument('-S','--subject',type=str,default=DEFAULT_SUBJECT,help="Subject folder containing stellafuzz.py")
+  parser.add_argument('--sizes',type=str,nargs='+',default=["1K", "1M", "100M"],help="Seed sizes, with an optional K or M suffix")
+  parser.add_argument('--messages',type=int,default=10000,help="Messages of the large test case and types of the long prompt")
+  parser.add_argument('--sequences',type=int,default=1000,help="Test cases, prompts and message types of the set benchmarks")
+  parser.add_argument('-n','--repeat',type=int,default=5,help="Maximum runs per benchmark")
+  parser.add_argument('--budget',type=float,default=2.0,help="Seconds after which a benchmark is not repeated any more")
+  parser.add_argument('--seed',type=int,default=0,help="Random seed")
+  parser.add_argument('-o','--out_file',type=str,default=None,help="Write the report as JSON to this file")
+  parser.add_argument('-b','--baseline',type=str,default=None,help="Report of an earlier run to compare against")
+  parser.add_argument('--tolerance',type=float,default=20,help="Allowed throughput loss against the baseline in percent")
+  args = parser.parse_args()
+
+  subject = os.path.abspath(args.subject)
+  sys.path.insert(0, subject)
+  from utility import utility
+  from LLM import testcases, normal_sequence, repeated_sequence
+
+  print(f"{'benchmark':>18} {'best (ms)':>12} {'throughput':>14}")
+  results = run_benchmarks(args, utility, testcases, normal_sequence, repeated_sequence)
+
+  regressions = []
+  if args.baseline:
+    with open(args.baseline, "r") as f:
+      baseline = json.load(f)["results"]
+    print(f"{'benchmark':>18} {'baseline':>14} {'now':>14} {'change':>8}")
+    for name, result in results.items():
+      reference = baseline.get(name)
+      if not reference:
+        continue
+      change = 100 * (result["throughput"] / reference["throughput"] - 1)
+      print(f"{name:>18} {reference['throughput']:>14.1f} {result['throughput']:>14.1f} {change:>+7.0f}%")
+      if change < -args.tolerance:
+        regressions.append(name)
+
+  if args.out_file:
+    with open(args.out_file, "w") as f:
+      json.dump({"subject": subject, "sizes": args.sizes, "messages": args.messages, "sequences": args.sequences, "results": results}, f, indent=2)
+  if regressions:
+    print(f"Throughput regressed by more than {args.tolerance:.0f}%: {', '.join(regressions)}")
+    sys.exit(1)
@@ -0,0 +1,406 @@
+#!/usr/bin/env python3
+
+# A local stand-in for the OpenAI chat completions endpoint used by the LLM
+# stages of stellafuzz.py (client.beta.chat.completions.parse). It answers
+# every structured-output request with a payload that is valid for the
+# requested schema, so the whole pipeline can be run and timed offline.
+#
+# The Files and Batches endpoints are emulated as well, so that the --batch
+# mode of stellafuzz.py can be exercised: a batch finishes --batch_latency
+# seconds after it was created.
+#
+# Point stellafuzz.py at it with:
+#   OPENAI_BASE_URL=http://127.0.0.1:8000/v1 OPENAI_API_KEY=mock python3 stellafuzz.py ...
+
+import re
+import json
+import math
+import time
+import random
+import argparse
+import threading
+from email import policy
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+def sample_latency(args) -> float:
+  if args.latency_dist == "fixed":
+    delay = args.latency
+  elif args.latency_dist == "uniform":
+    delay = random.uniform(max(0.0, args.latency - args.latency_spread), args.latency + args.latency_spread)
+  elif args.latency_dist == "normal":
+    delay = random.gauss(args.latency, args.latency_spread)
+  elif args.latency_dist == "exponential":
+    delay = random.expovariate(1 / args.latency) if args.latency > 0 else 0.0
+  else:
+    # lognormal with the given mean and standard deviation
+    mean, spread = args.latency, args.latency_spread
+    if mean <= 0:
+      return 0.0
+    sigma2 = math.log(1 + (spread / mean) ** 2)
+    delay = random.lognormvariate(math.log(mean) - sigma2 / 2, sigma2 ** 0.5)
+  return max(0.0, delay)
+
+#Prompt parsing helpers -- the prompts are the templates of benchmark/subjects/*/LLM
+def prompt_protocol(prompt: str) -> str:
+  match = re.search(r"deep understanding of (\S+?)\.", prompt)
+  return match.group(1) if match else "PROTOCOL"
+
+def prompt_listed_types(prompt: str) -> list:
+  match = re.search(r"client-to-server message types:\n(.*?)\n\n", prompt, re.S)
+  if not match:
+    return []
+  return [line[2:].strip() for line in match.group(1).splitlines() if line.startswith("- ")]
+
+def prompt_type_sequence(prompt: str) -> list:
+  match = re.search(r"\*\*Type Sequence:\*\*\s*\n(.*?)\n\n", prompt, re.S)
+  if not match:
+    return []
+  return [re.sub(r"^\d+\.\s*", "", line).strip() for line in match.group(1).splitlines() if line.strip()]
+
+def prompt_seed_message(prompt: str) -> str:
+  match = re.search(r"Seed Message:\n(.*?)\n\nPlease adhere", prompt, re.S)
+  return match.group(1) if match else ""
+
+#Payload generators, one per response schema of the pipeline
+def message_types(prompt, args):
+  names = [f"TYPE_{i}" for i in range(args.types)]
+  return {
+    "protocol": prompt_protocol(prompt),
+    "client_to_server_messages": [{"name": name, "code": str(i), "description": f"Mock message type {name}"} for i, name in enumerate(names)],
+    "potential_candidates": None,
+    "references": ["mock"],
+    "notes": None,
+  }
+
+def structured_output(prompt, args):
+  match = re.search(r"client-to-server message type (\S+) in the", prompt)
+  name = match.group(1) if match else "TYPE"
+  return {
+    "protocol": prompt_protocol(prompt),
+    "message_type": name,
+    "code": None,
+    "type_description": f"Mock structure of {name}",
+    "fields": [
+      {"name": f"field_{i}", "fixed_byte_length": 4 if i % 2 else None, "data_type": "string", "description": "Mock field", "details": None}
+      for i in range(args.fields)
+    ],
+    "reasoning": "mock",
+  }
+
+def protocol_sequences(prompt, args):
+  types = prompt_listed_types(prompt) or ["TYPE_0"]
+  sequences = []
+  for i in range(args.sequences):
+    length = random.randint(args.sequence_length // 2 + 1, args.sequence_length)
+    sequences.append({"sequenceId": str(i + 1), "type_sequence": [random.choice(types) for _ in range(length)]})
+  return {"protocol": prompt_protocol(prompt), "sequences": sequences, "explanation": "mock"}
+
+def parsed_messages(prompt, args):
+  seed = prompt_seed_message(prompt)
+  chunks = [chunk for chunk in re.split(r"(?<=\r\n)|(?<=\n)", seed) if chunk.strip()] or [seed]
+  return {"message_sequences": [{"message": chunk} for chunk in chunks]}
+
+def test_case(prompt, args):
+  types = prompt_type_sequence(prompt) or ["TYPE_0"]
+  sequences = []
+  for i in range(args.test_sequences):
+    messages = []
+    for name in types:
+      if args.binary:
+        payload = " ".join(f"0x{random.randrange(256):02x}" for _ in range(args.message_bytes))
+      else:
+        payload = f"{name} arg{random.randrange(10000)}"
+      messages.append({"message": payload})
+    sequences.append({"sequenceId": str(i + 1), "messages": messages, "explanation": "mock"})
+  return {"protocol": prompt_protocol(prompt), "sequences": sequences}
+
+GENERATORS = {
+  "ProtocolMessageTypes": message_types,
+  "StructuredOutput": structured_output,
+  "ProtocolSequences": protocol_sequences,
+  "ParsedMessages": parsed_messages,
+  "TestCase": test_case,
+}
+
+def schema_instance(schema: dict, defs: dict):
+  """Generic fallback: the smallest instance of an arbitrary JSON schema."""
+  if "$ref" in schema:
+    return schema_instance(defs[schema["$ref"].split("/")[-1]], defs)
+  if "anyOf" in schema:
+    return schema_instance(schema["anyOf"][0], defs)
+  kind = schema.get("type")
+  if isinstance(kind, list):
+    kind = kind[0]
+  if kind == "object":
+    return {name: schema_instance(prop, defs) for name, prop in schema.get("properties", {}).items()}
+  if kind == "array":
+    return [schema_instance(schema.get("items", {}), defs)]
+  return {"string": "mock", "integer": 0, "number": 0.0, "boolean": False, "null": None}.get(kind, None)
+
+class Stats:
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.counts = {}
+    self.started = time.time()
+    self.window = []
+
+  def add(self, key: str) -> None:
+    with self.lock:
+      self.counts[key] = self.counts.get(key, 0) + 1
+
+  def over_limit(self, rpm: int) -> bool:
+    """Sliding one-minute window of accepted requests."""
+    if rpm <= 0:
+      return False
+    with self.lock:
+      now = time.time()
+      self.window = [t for t in self.window if now - t < 60]
+      if len(self.window) >= rpm:
+        return True
+      self.window.append(now)
+      return False
+
+  def snapshot(self) -> dict:
+    with self.lock:
+      return {"uptime": time.time() - self.started, "counts": dict(self.counts)}
+
+class BatchStore:
+  """In-memory Files and Batches API state."""
+
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.files = {}
+    self.batches = {}
+
+  def add_file(self, filename: str, purpose: str, data: bytes) -> dict:
+    file_id = f"file-mock-{random.getrandbits(64):x}"
+    info = {"id": file_id, "object": "file", "bytes": len(data), "created_at": int(time.time()),
+            "filename": filename, "purpose": purpose, "status": "processed"}
+    with self.lock:
+      self.files[file_id] = (info, data)
+    return info
+
+  def create_batch(self, request: dict, args, stats) -> dict:
+    batch = {
+      "id": f"batch_mock_{random.getrandbits(64):x}",
+      "object": "batch",
+      "endpoint": request.get("endpoint", "/v1/chat/completions"),
+      "errors": None,
+      "input_file_id": request["input_file_id"],
+      "completion_window": request.get("completion_window", "24h"),
+      "status": "validating",
+      "output_file_id": None,
+      "error_file_id": None,
+      "created_at": int(time.time()),
+      "completed_at": None,
+      "request_counts": {"total": 0, "completed": 0, "failed": 0},
+    }
+    with self.lock:
+      self.batches[batch["id"]] = batch
+    threading.Thread(target=self.process_batch, args=(batch, args, stats), daemon=True).start()
+    return batch
+
+  def process_batch(self, batch: dict, args, stats) -> None:
+    with self.lock:
+      _, data = self.files[batch["input_file_id"]]
+      batch["status"] = "in_progress"
+    results = []
+    completed = failed = 0
+    for line in data.decode("utf-8").splitlines():
+      if not line.strip():
+        continue
+      request = json.loads(line)
+      if random.random() < args.error_rate:
+        stats.add("batch_500")
+        failed += 1
+        response = {"status_code": 500, "request_id": "mock", "body": {"error": {"message": "Internal error (mock)"}}}
+      else:
+        stats.add("batch_200")
+        completed += 1
+        response = {"status_code": 200, "request_id": "mock", "body": completion(request["body"], args)}
+      results.append(json.dumps({"id": f"batch_req_{random.getrandbits(64):x}", "custom_id": request["custom_id"],
+                                 "response": response, "error": None}))
+    time.sleep(args.batch_latency)
+
+    output = self.add_file(f"{batch['id']}_output.jsonl", "batch_output", ("\n".join(results) + "\n").encode("utf-8"))
+    with self.lock:
+      if batch["status"] == "cancelling":
+        batch["status"] = "cancelled"
+        return
+      batch["status"] = "completed"
+      batch["completed_at"] = int(time.time())
+      batch["output_file_id"] = output["id"]
+      batch["request_counts"] = {"total": completed + failed, "completed": completed, "failed": failed}
+
+  def cancel_batch(self, batch_id: str) -> dict:
+    with self.lock:
+      batch = self.batches[batch_id]
+      if batch["status"] not in ("completed", "failed", "expired", "cancelled"):
+        batch["status"] = "cancelling"
+      return dict(batch)
+
+def parse_multipart(content_type: str, body: bytes) -> dict:
+  message = BytesParser(policy=policy.HTTP).parsebytes(f"Content-Type: {content_type}\r\n\r\n".encode("latin-1") + body)
+  fields = {}
+  for part in message.iter_parts():
+    name = part.get_param("name", header="content-disposition")
+    fields[name] = (part.get_filename(), part.get_payload(decode=True))
+  return fields
+
+def make_handler(args, stats, store):
+  class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *values):
+      if args.verbose:
+        super().log_message(format, *values)
+
+    def send_json(self, status: int, payload: dict, headers: dict = None) -> None:
+      body = json.dumps(payload).encode("utf-8")
+      self.send_response(status)
+      self.send_header("Content-Type", "application/json")
+      self.send_header("Content-Length", str(len(body)))
+      for name, value in (headers or {}).items():
+        self.send_header(name, value)
+      self.end_headers()
+      self.wfile.write(body)
+
+    def read_body(self) -> bytes:
+      length = int(self.headers.get("Content-Length", 0))
+      return self.rfile.read(length)
+
+    def read_json(self) -> dict:
+      return json.loads(self.read_body() or b"{}")
+
+    def not_found(self) -> None:
+      self.send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def do_GET(self):
+      path = self.path.rstrip("/")
+      if path == "/stats":
+        self.send_json(200, stats.snapshot())
+      elif match := re.search(r"/files/([^/]+)/content$", path):
+        if match.group(1) not in store.files:
+          return self.not_found()
+        _, data = store.files[match.group(1)]
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+      elif match := re.search(r"/files/([^/]+)$", path):
+        if match.group(1) not in store.files:
+          return self.not_found()
+        self.send_json(200, store.files[match.group(1)][0])
+      elif match := re.search(r"/batches/([^/]+)$", path):
+        if match.group(1) not in store.batches:
+          return self.not_found()
+        with store.lock:
+          self.send_json(200, dict(store.batches[match.group(1)]))
+      else:
+        self.not_found()
+
+    def do_POST(self):
+      path = self.path.rstrip("/")
+      if path.endswith("/chat/completions"):
+        self.chat_completion(self.read_json())
+      elif path.endswith("/files"):
+        fields = parse_multipart(self.headers["Content-Type"], self.read_body())
+        filename, data = fields["file"]
+        purpose = fields.get("purpose", (None, b"batch"))[1].decode("utf-8")
+        self.send_json(200, store.add_file(filename or "upload.jsonl", purpose, data))
+      elif path.endswith("/batches"):
+        request = self.read_json()
+        if request.get("input_file_id") not in store.files:
+          return self.send_json(400, {"error": {"message": "Unknown input file"}})
+        self.send_json(200, store.create_batch(request, args, stats))
+      elif match := re.search(r"/batches/([^/]+)/cancel$", path):
+        if match.group(1) not in store.batches:
+          return self.not_found()
+        self.send_json(200, store.cancel_batch(match.group(1)))
+      else:
+        self.not_found()
+
+    def chat_completion(self, request: dict) -> None:
+      time.sleep(sample_latency(args))
+
+      if random.random() < args.rate_limit_rate or stats.over_limit(args.rpm):
+        stats.add("429")
+        self.send_json(429, {"error": {"message": "Rate limit reached (mock)", "type": "requests", "code": "rate_limit_exceeded"}},
+                       {"retry-after": str(args.retry_after)})
+        return
+      if random.random() < args.error_rate:
+        stats.add("500")
+        self.send_json(500, {"error": {"message": "Internal error (mock)", "type": "server_error"}})
+        return
+
+      self.send_json(200, completion(request, args))
+      stats.add("200")
+
+  return Handler
+
+def completion(request: dict, args) -> dict:
+  prompt = request["messages"][-1]["content"]
+  response_format = request.get("response_format", {}).get("json_schema", {})
+  name = response_format.get("name")
+  if name in GENERATORS:
+    payload = GENERATORS[name](prompt, args)
+  else:
+    schema = response_format.get("schema", {})
+    payload = schema_instance(schema, schema.get("$defs", {}))
+  content = json.dumps(payload)
+  prompt_tokens = sum(len(message["content"]) for message in request["messages"]) // 4
+  completion_tokens = len(content) // 4
+  return {
+    "id": f"chatcmpl-mock-{random.getrandbits(64):x}",
+    "object": "chat.completion",
+    "created": int(time.time()),
+    "model": request.get("model", "mock"),
+    "choices": [{
+      "index": 0,
+      "finish_reason": "stop",
+      "logprobs": None,
+      "message": {"role": "assistant", "content": content, "refusal": None},
+    }],
+    "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens},
+  }
+
+def build_parser(add_help: bool = True) -> argparse.ArgumentParser:
+  parser = argparse.ArgumentParser(description="Local OpenAI-compatible stand-in for benchmarking the SteLLaFuzz pipeline", add_help=add_help)
+  parser.add_argument('--host',type=str,default="127.0.0.1")
+  parser.add_argument('--port',type=int,default=8000)
+  parser.add_argument('--latency',type=float,default=1.0,help="Mean response latency in seconds")
+  parser.add_argument('--latency_spread',type=float,default=0.5,help="Spread (stddev or half-width) of the latency")
+  parser.add_argument('--latency_dist',type=str,default="lognormal",choices=["fixed", "uniform", "normal", "exponential", "lognormal"])
+  parser.add_argument('--error_rate',type=float,default=0.0,help="Fraction of requests answered with HTTP 500")
+  parser.add_argument('--rate_limit_rate',type=float,default=0.0,help="Fraction of requests answered with HTTP 429")
+  parser.add_argument('--rpm',type=int,default=0,help="Answer with HTTP 429 above this many requests per minute (0: no limit)")
+  parser.add_argument('--retry_after',type=float,default=1.0,help="Retry-After value sent with HTTP 429, in seconds")
+  parser.add_argument('--types',type=int,default=30,help="Number of message types returned")
+  parser.add_argument('--fields',type=int,default=5,help="Number of fields per message structure")
+  parser.add_argument('--sequences',type=int,default=10,help="Number of message sequences returned")
+  parser.add_argument('--sequence_length',type=int,default=6,help="Maximum length of a message sequence")
+  parser.add_argument('--test_sequences',type=int,default=1,help="Number of sequences per generated test case")
+  parser.add_argument('--binary',action='store_true',help="Generate 0xHH-encoded binary test case messages")
+  parser.add_argument('--message_bytes',type=int,default=64,help="Bytes per binary test case message")
+  parser.add_argument('--batch_latency',type=float,default=5.0,help="Seconds until a batch job completes")
+  parser.add_argument('--seed',type=int,default=None,help="Random seed")
+  parser.add_argument('-v','--verbose',action='store_true')
+  return parser
+
+def serve(args) -> ThreadingHTTPServer:
+  if args.seed is not None:
+    random.seed(args.seed)
+  server = ThreadingHTTPServer((args.host, args.port), make_handler(args, Stats(), BatchStore()))
+  server.daemon_threads = True
+  return server
+
+if __name__ == '__main__':
+  args = build_parser().parse_args()
+  server = serve(args)
+  print(f"Mock LLM listening on http://{args.host}:{server.server_address[1]}/v1", flush=True)
+  try:
+    server.serve_forever()
+  except KeyboardInterrupt:
+    pass
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+
+# Measures the startup cost of stellafuzz.py with `python -X importtime`.
+#
+# Every scenario is started -n times in a fresh interpreter in the subject
+# folder. The report gives the median wall time, the median time spent in
+# imports and the heaviest top-level imports. With -b, the medians are
+# compared against a report written earlier with -o, and the script exits
+# with status 1 if a scenario got slower by more than --tolerance percent.
+#
+# Example:
+#   stellafuzz_startup_bench.py -o startup.json
+#   stellafuzz_startup_bench.py -b startup.json
+
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SUBJECT = os.path.join(SCRIPT_DIR, "..", "..", "subjects", "FTP", "LightFTP")
+
+STAGE_MODULES = "LLM.protocol_types, LLM.specialized_structures, LLM.normal_sequence, LLM.repeated_sequence, LLM.testcases, LLM.structured_seed_message"
+
+# name: arguments after `python -X importtime`
+SCENARIOS = {
+  "help": ["stellafuzz.py", "--help"],                                 # entry point up to argument parsing
+  "pipeline": ["-c", f"import {STAGE_MODULES}"],                        # what a replayed or cached run loads
+  "client": ["-c", "from LLM.client import get_client; get_client()"],  # first request to the API
+}
+
+IMPORT_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+def parse_importtime(stderr: str) -> dict:
+  total = 0
+  top_level = {}
+  for line in stderr.splitlines():
+    match = IMPORT_LINE.match(line)
+    if not match:
+      continue
+    self_us, cumulative_us, indent, name = int(match.group(1)), int(match.group(2)), match.group(3), match.group(4)
+    total += self_us
+    if len(indent) == 1:
+      top_level[name] = top_level.get(name, 0) + cumulative_us
+  return {"import_us": total, "top_level": top_level}
+
+def run_scenario(subject: str, arguments: list, repeat: int) -> dict:
+  wall = []
+  imports = []
+  top_level = {}
+  env = dict(os.environ, OPENAI_API_KEY=os.environ.get("OPENAI_API_KEY", "startup-bench"))
+  for _ in range(repeat):
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-X", "importtime"] + arguments, cwd=subject, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    wall.append(time.perf_counter() - start)
+    if result.returncode != 0:
+      raise Exception(f"{' '.join(arguments)} exited with {result.returncode}: {result.stderr.splitlines()[-1:]}")
+    parsed = parse_importtime(result.stderr)
+    imports.append(parsed["import_us"])
+    for name, cumulative_us in parsed["top_level"].items():
+      top_level.setdefault(name, []).append(cumulative_us)
+  heaviest = sorted(((statistics.median(values), name) for name, values in top_level.items()), reverse=True)[:5]
+  return {"wall_ms": statistics.median(wall) * 1000, "import_ms": statistics.median(imports) / 1000,
+          "heaviest": {name: us / 1000 for us, name in heaviest}}
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description="Startup time benchmark of stellafuzz.py based on python -X importtime")
+  parser.add_argument('-S','--subject',type=str,default=DEFAULT_SUBJECT,help="Subject folder containing stellafuzz.py")
+  parser.add_argument('-n','--repeat',type=int,default=5,help="Interpreter starts per scenario")
+  parser.add_argument('-s','--scenarios',type=str,nargs='+',default=list(SCENARIOS),choices=list(SCENARIOS),help="Scenarios to run")
+  parser.add_argument('-o','--out_file',type=str,default=None,help="Write the report as JSON to this file")
+  parser.add_argument('-b','--baseline',type=str,default=None,help="Report of an earlier run to compare against")
+  parser.add_argument('--tolerance',type=float,default=20,help="Allowed slowdown against the baseline in percent")
+  args = parser.parse_args()
+
+  subject = os.path.abspath(args.subject)
+  report = {name: run_scenario(subject, SCENARIOS[name], args.repeat) for name in args.scenarios}
+  baseline = None
+  if args.baseline:
+    with open(args.baseline, "r") as f:
+      baseline = json.load(f)
+
+  regressions = []
+  print(f"{'scenario':>10} {'wall (ms)':>10} {'imports (ms)':>13} {'baseline':>9}  heaviest imports (ms)")
+  for name, result in report.items():
+    reference = baseline.get(name) if baseline else None
+    change = "-"
+    if reference:
+      change = f"{100 * (result['import_ms'] / reference['import_ms'] - 1):+.0f}%"
+      if result["import_ms"] > reference["import_ms"] * (1 + args.tolerance / 100):
+        regressions.append(name)
+    heaviest = ", ".join(f"{module} {ms:.0f}" for module, ms in result["heaviest"].items())
+    print(f"{name:>10} {result['wall_ms']:>10.1f} {result['import_ms']:>13.1f} {change:>9}  {heaviest}")
+
+  if args.out_file:
+    with open(args.out_file, "w") as f:
+      json.dump(report, f, indent=2)
+  if regressions:
+    print(f"Import time regressed by more than {args.tolerance:.0f}%: {', '.join(regressions)}")
+    sys.exit(1)
@@ -1,10 +1,10 @@
 import os
-import json
 
-from typing import Optional, List
+from typing import List
 from pydantic import BaseModel
-from openai import OpenAI
-from utility.utility import MODEL, LLM_RETRY, LLM_RESULT_DIR
+from LLM.client import request_completion
+from utility.utility import LLM_RETRY, LLM_RESULT_DIR
+from utility.artifacts import save_artifact, artifact_suffix
 
 MESSAGE_SEQUENCE_OUTPUT_DIR = "message_sequence_results"
 
@@ -69,41 +69,19 @@ Please generate the final message call sequences strictly following the above in
 """
 
 def using_llm(prompt: str) -> ProtocolSequences:
-    client = OpenAI()
     try:
-        completion = client.beta.chat.completions.parse(
-            model=MODEL,
-            temperature=0.7,
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant."},
-                {"role": "user", "content": prompt}
-            ],
-            response_format=ProtocolSequences,
-            timeout=90
-        )
-        response = completion.choices[0].message.parsed
-
-        index = 0
-        os.makedirs(os.path.join(LLM_RESULT_DIR, "3_message_sequences"), exist_ok=True)
-        while os.path.exists(os.path.join(LLM_RESULT_DIR, "3_message_sequences", f"response_{index}.json")):
-            index += 1
-        protocol_file = os.path.join(LLM_RESULT_DIR, "3_message_sequences", f"response_{index}.json")
-        with open(protocol_file, "w", encoding="utf-8") as f:
-            json.dump(completion.model_dump(), f, indent=4, ensure_ascii=False)
-        return response
+        return request_completion(prompt, ProtocolSequences, "3_message_sequences", temperature=0.7, timeout=90)
     except Exception as e:
         print(f"Error processing protocol: {e}")
         return None
 
-def get_message_sequences(protocol: str, message_types: dict) -> dict:
-    types_list = [type["name"] for type in message_types["client_to_server_messages"]]
-    types = ""
-    for type in types_list:
-        types += f"- {type}\n"
-    types = types.strip()
+def build_message_sequence_prompt(protocol: str, message_types: dict) -> str:
+    types = "\n".join(f"- {type['name']}" for type in message_types["client_to_server_messages"])
+    return MESSAGE_PROMPT.replace("[PROTOCOL]", protocol)\
+                         .replace("[TYPES]", types)
 
-    prompt = MESSAGE_PROMPT.replace("[PROTOCOL]", protocol)\
-                           .replace("[TYPES]", types)
+def get_message_sequences(protocol: str, message_types: dict) -> dict:
+    prompt = build_message_sequence_prompt(protocol, message_types)
 
     for _ in range(LLM_RETRY):
         response = using_llm(prompt)
@@ -114,16 +92,8 @@ def get_message_sequences(protocol: str, message_types: dict) -> dict:
         raise Exception(f"Failed to generate message sequence for {protocol}")
 
     # Save the results to a JSON file
-    os.makedirs(MESSAGE_SEQUENCE_OUTPUT_DIR, exist_ok=True)
-    file_path = os.path.join(MESSAGE_SEQUENCE_OUTPUT_DIR, f"{protocol.lower()}_message_sequences.json")
-    with open(file_path, "w", encoding="utf-8") as f:
-        json.dump(response.model_dump(), f, indent=4, ensure_ascii=False)    
+    file_path = save_artifact(os.path.join(LLM_RESULT_DIR, f"3_{protocol.lower()}_message_sequences{artifact_suffix()}"), response.model_dump(),
+                              [os.path.join(MESSAGE_SEQUENCE_OUTPUT_DIR, f"{protocol.lower()}_message_sequences{artifact_suffix()}")])
     print(f"Saved results for {protocol} to {file_path}")
 
-    # Save the prompt and response to a text file
-    os.makedirs(LLM_RESULT_DIR, exist_ok=True)
-    protocol_file = os.path.join(LLM_RESULT_DIR, f"3_{protocol.lower()}_message_sequences.json")
-    with open(protocol_file, "w", encoding="utf-8") as f:
-        json.dump(response.model_dump(), f, indent=4, ensure_ascii=False)
-
     return response.model_dump()
@@ -1,10 +1,10 @@
 import os
-import json
 
 from typing import Optional, List
 from pydantic import BaseModel
-from openai import OpenAI
-from utility.utility import MODEL, LLM_RETRY, LLM_RESULT_DIR
+from LLM.client import request_completion
+from utility.utility import LLM_RETRY, LLM_RESULT_DIR
+from utility.artifacts import save_artifact, artifact_suffix
 
 PROTOCOL_TYPE_OUTPUT_DIR = "protocol_type_results"
 
@@ -87,28 +87,8 @@ Please extract all client-to-server message types for [PROTOCOL] following the a
 """
 
 def using_llm(prompt: str) -> ProtocolMessageTypes:
-    client = OpenAI()
     try:
-        completion = client.beta.chat.completions.parse(
-            model=MODEL,
-            temperature=0.1,
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant."},
-                {"role": "user", "content": prompt}
-            ],
-            response_format=ProtocolMessageTypes,
-            timeout=90
-        )
-        response = completion.choices[0].message.parsed
-
-        index = 0
-        os.makedirs(os.path.join(LLM_RESULT_DIR, "1_types"), exist_ok=True)
-        while os.path.exists(os.path.join(LLM_RESULT_DIR, "1_types", f"response_{index}.json")):
-            index += 1
-        protocol_file = os.path.join(LLM_RESULT_DIR, "1_types", f"response_{index}.json")
-        with open(protocol_file, "w", encoding="utf-8") as f:
-            json.dump(completion.model_dump(), f, indent=4, ensure_ascii=False)
-        return response
+        return request_completion(prompt, ProtocolMessageTypes, "1_types", temperature=0.1, timeout=90)
     except Exception as e:
         print(f"Error processing protocol: {e}")
         return None
@@ -124,15 +104,8 @@ def get_protocol_message_types(protocol: str) -> dict:
     if response is None:
         raise Exception(f"Failed to generate message types for {protocol}")
 
-    os.makedirs(PROTOCOL_TYPE_OUTPUT_DIR, exist_ok=True)    
-    protocol_file = os.path.join(PROTOCOL_TYPE_OUTPUT_DIR, f"{protocol.lower()}_types.json")
-    with open(protocol_file, "w", encoding="utf-8") as f:
-        json.dump(response.model_dump(), f, indent=4, ensure_ascii=False)
+    protocol_file = save_artifact(os.path.join(LLM_RESULT_DIR, f"1_{protocol.lower()}_types{artifact_suffix()}"), response.model_dump(),
+                                  [os.path.join(PROTOCOL_TYPE_OUTPUT_DIR, f"{protocol.lower()}_types{artifact_suffix()}")])
     print(f"Saved results for {protocol} to {protocol_file}")
 
-    os.makedirs(LLM_RESULT_DIR, exist_ok=True)    
-    protocol_file = os.path.join(LLM_RESULT_DIR, f"1_{protocol.lower()}_types.json")
-    with open(protocol_file, "w", encoding="utf-8") as f:
-        json.dump(response.model_dump(), f, indent=4, ensure_ascii=False)
-
     return response.model_dump()
@@ -0,0 +1,131 @@
+import os
+import json
+import time
+import hashlib
+import tempfile
+import threading
+
+from functools import lru_cache
+from typing import Optional, Type
+from pydantic import BaseModel
+from utility.utility import make_readable, LLM_CACHE_DIR, LLM_CACHE_MAX_BYTES, LLM_CACHE_MAX_AGE
+
+@lru_cache(maxsize=None)
+def schema_hash(response_format: Type[BaseModel]) -> str:
+    schema = json.dumps(response_format.model_json_schema(), sort_keys=True)
+    return hashlib.sha256(schema.encode("utf-8")).hexdigest()
+
+def request_key(model: str, temperature: Optional[float], prompt: str, response_format: Type[BaseModel]) -> str:
+    """Content address of a request: model, temperature, prompt and response schema."""
+    prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+    key = json.dumps([model, temperature, prompt_hash, schema_hash(response_format)])
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    """On-disk cache of parsed LLM responses, shared by every stage.
+
+    Entries are written atomically, through temporary dot files that readers
+    and eviction skip, and are readable by every user, so that several
+    fuzzing campaigns can share one mounted directory. The modification time of an entry is its last use;
+    entries unused for longer than max_age seconds are dropped, and the least
+    recently used ones are evicted once the cache grows beyond max_bytes.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = LLM_CACHE_MAX_BYTES, max_age: float = LLM_CACHE_MAX_AGE):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        self.size = self.evict()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def contains(self, key: str) -> bool:
+        return os.path.exists(self.path(key))
+
+    def get(self, key: str, response_format: Type[BaseModel]) -> Optional[BaseModel]:
+        path = self.path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            response = response_format.model_validate(entry["response"])
+            os.utime(path)
+        except FileNotFoundError:
+            response = None
+        except Exception as e:
+            # A truncated or outdated entry is treated as a miss.
+            print(f"Ignoring cache entry {path}: {e}")
+            response = None
+
+        with self.lock:
+            if response is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return response
+
+    def put(self, key: str, response: BaseModel) -> None:
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        entry = {
+            "schema": type(response).__name__,
+            "created": time.time(),
+            "response": response.model_dump(),
+        }
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".", suffix=".tmp")
+        make_readable(fd)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+        with self.lock:
+            self.size += os.path.getsize(path)
+            if self.size > self.max_bytes:
+                self.size = self.evict()
+
+    def evict(self) -> int:
+        """Drop expired entries, then the least recently used ones while the
+        cache is over its size limit. Returns the remaining size in bytes."""
+        entries = []
+        now = time.time()
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.startswith("."):
+                    # An entry that is still being written.
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                if now - stat.st_mtime > self.max_age:
+                    self.remove(path)
+                else:
+                    entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self.remove(path)
+            total -= size
+        return total
+
+    @staticmethod
+    def remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+cache: Optional[ResponseCache] = None
+
+def configure_cache(cache_dir: Optional[str] = LLM_CACHE_DIR) -> Optional[ResponseCache]:
+    """Enable the response cache in cache_dir, or disable it when cache_dir is empty."""
+    global cache
+    cache = ResponseCache(cache_dir) if cache_dir else None
+    return cache
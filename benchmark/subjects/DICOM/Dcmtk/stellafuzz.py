@@ -1,62 +1,203 @@
 import os
+import sys
 import json
 import argparse
 
-from LLM.protocol_types import get_protocol_message_types
-from LLM.specialized_structures import get_specialized_structures
-from LLM.normal_sequence import get_message_sequences
-from LLM.repeated_sequence import get_repeated_message_sequences
-from LLM.testcases import get_test_cases
-from LLM.structured_seed_message import get_structured_seed_message
-from utility.utility import save_test_cases, load_seed_messages
+from utility.utility import CorpusWriter, has_seeds, iter_seed_files, is_generated_seed, read_seed_message, use_pregenerated, LLM_CONCURRENCY, LLM_CACHE_DIR, LLM_RESULT_DIR, LLM_ARTIFACT_FORMAT, METRICS_TEXTFILE, PROFILE_DIR, MODEL
+from utility.scheduler import StageScheduler
+from utility.artifacts import configure_artifacts
+from utility.metrics import metrics
+from utility import profiler
+from utility.checkpoint import configure_checkpoint, file_digest
 
-def main() -> None:
+def main() -> int:
+    """Returns the exit status: 1 if a stage failed or is incomplete, or the output directory holds no seeds."""
     parser = argparse.ArgumentParser()
     parser.add_argument("--protocol", "-p", type=str, required=True)
     parser.add_argument("--output_dir", "-o", type=str, required=False, default="results")
     parser.add_argument("--seed_messages", "-s", type=str, required=False, default=None, help="Path to initial seed messages")
+    parser.add_argument("--jobs", "-j", type=int, required=False, default=LLM_CONCURRENCY, help="Maximum number of concurrent LLM requests")
+    parser.add_argument("--cache_dir", type=str, required=False, default=LLM_CACHE_DIR, help="Directory of the shared LLM response cache")
+    parser.add_argument("--llm_mode", "--llm-mode", type=str, required=False, default="live", choices=["live", "record", "replay"], help="Send requests to the LLM (live), also write them to a cassette (record) or serve them from one without network access (replay)")
+    parser.add_argument("--cassette", type=str, required=False, default=os.path.join(LLM_RESULT_DIR, "cassette.jsonl"), help="Cassette file to record to or replay from; replay also accepts an llm_outputs directory")
+    parser.add_argument("--sync_dir", type=str, required=False, default=None, help="Also add every seed to the stellafuzz queue of this afl-fuzz sync directory")
+    parser.add_argument("--replayable_dir", type=str, required=False, default=None, help="Also write every seed in aflnet's replayable format (size-prefixed messages) to this directory, and its message regions to <dir>/regions")
+    parser.add_argument("--keep_duplicates", action="store_true", help="Also write seeds that are byte-identical to a seed in the output directory")
+    parser.add_argument("--cmin_cmd", type=str, required=False, default=None, help="Coverage command for afl-cmin style minimization of the new seeds; {seed} is replaced by the seed path and {map} by an output file, e.g. \"afl-showmap -q -o {map} -- ./target {seed}\"")
+    parser.add_argument("--artifact_format", type=str, required=False, default=LLM_ARTIFACT_FORMAT, choices=["json", "zst"], help="Write stage results and completions as compact JSON or zstd-compressed JSON (needs zstandard)")
+    parser.add_argument("--batch", action="store_true", help="Submit the structure and test case prompts as Batch API jobs instead of interactive requests")
+    parser.add_argument("--metrics_textfile", type=str, required=False, default=METRICS_TEXTFILE, help="Prometheus textfile with the stage and LLM request metrics, written at exit next to llm_outputs/metrics.json; empty to skip")
+    parser.add_argument("--profile", type=str, nargs="?", const=PROFILE_DIR, default=None, help=f"Sample the stacks of every stage and write wall and CPU time flame graphs (folded stacks) to this directory, {PROFILE_DIR} if omitted")
+    parser.add_argument("--checkpoint", type=str, required=False, default=os.path.join(LLM_RESULT_DIR, "checkpoint.jsonl"), help="Manifest of the completed stages and LLM calls of this run, kept outside the output directory; empty to disable")
+    parser.add_argument("--resume", action="store_true", help="Reuse the stages and LLM calls completed by an earlier run (see --checkpoint) and only run what is missing")
+    parser.add_argument("--pregenerated", type=str, required=False, default=None, help="Instead of running the pipeline, copy the corpus and llm_outputs generated once per campaign into this directory (see profuzzbench_pregen_stellafuzz.sh)")
+    parser.add_argument("--sample_rate", type=float, required=False, default=1.0, help="Share of the pre-generated seeds to copy")
+    parser.add_argument("--sample_seed", type=int, required=False, default=0, help="Random seed of the sample, e.g. the run number, so that runs start from different corpora")
     args = parser.parse_args()
 
+    if args.pregenerated:
+        # The LLM pipeline already ran once for the campaign; copying its
+        # output needs neither the stages nor their dependencies.
+        seeds = use_pregenerated(args.pregenerated, args.output_dir, args.sample_rate, args.sample_seed)
+        print(f"Copied {len(seeds)} pre-generated seeds from {args.pregenerated} to {args.output_dir}")
+        return 0 if has_seeds(args.output_dir) else 1
+
+    # The stages pull in pydantic and their prompts and models; importing them
+    # only after the arguments are parsed keeps --help and argument errors fast.
+    from LLM.protocol_types import get_protocol_message_types
+    from LLM.specialized_structures import get_specialized_structures
+    from LLM.normal_sequence import get_message_sequences
+    from LLM.repeated_sequence import get_repeated_message_sequences
+    from LLM.testcases import get_test_cases
+    from LLM.cache import configure_cache
+    from LLM.cassette import configure_cassette
+    from LLM.client import report_connections
+    from LLM.rate_limit import limiter, report_retries
+
     protocol = args.protocol
     output_dir = args.output_dir
     seed_messages_dir = args.seed_messages
+    jobs = args.jobs
+    limiter.limit_in_flight(jobs)
+    cache = configure_cache(args.cache_dir)
+    configure_cassette(args.llm_mode, args.cassette)
+    configure_artifacts(args.artifact_format)
+    checkpoint = configure_checkpoint(args.checkpoint, args.resume, {"protocol": protocol, "model": MODEL})
+    writer = CorpusWriter(output_dir, args.sync_dir, protocol, args.replayable_dir, not args.keep_duplicates)
+    sampler = None
+    if args.profile:
+        sampler = profiler.SamplingProfiler()
+        sampler.start()
     
+    status = 0
     try:
-        result = load_seed_messages(seed_messages_dir) if seed_messages_dir else (None, None)
-        file_names, seed_messages = result
+        # run.sh writes the corpus into the seed folder; the seeds of earlier
+        # runs found there are outputs, not inputs.
+        seed_files = [(file_name, file_path) for file_name, file_path in iter_seed_files(seed_messages_dir)
+                      if not is_generated_seed(file_name)] if seed_messages_dir else []
+
+        # Only the message types are a real prerequisite of the other stages;
+        # everything else runs as soon as its own inputs are available.
+        scheduler = StageScheduler(max_workers=jobs)
+
+        def generate_test_cases(stage: str, sequence_stage: str, message_sequences: dict, specialized_structures: dict, structured_seed_message: dict,
+                                file_name: str) -> dict:
+            if not message_sequences:
+                return {}
+            # Seeds are named after the stage and position of their sequence,
+            # not after the order the test cases arrive in.
+            indices = {}
+            for index, sequence in enumerate(message_sequences["sequences"]):
+                indices.setdefault(sequence["sequenceId"], index)
+            # Seeds are written as each test case arrives, so that a fuzzer
+            # can start on them before the whole pipeline has finished.
+            def save(sequence_id: str, test_case: dict) -> None:
+                with profiler.stage("saving"):
+                    writer.write((sequence_stage, indices[sequence_id]), test_case, file_name)
+            test_cases = get_test_cases(protocol, message_sequences, specialized_structures, structured_seed_message, jobs, args.batch, save, stage)
+            # Test cases that could not be saved on arrival are retried here;
+            # the writer skips the ones that are already on disk.
+            with profiler.stage("saving"):
+                writer.write_all({(sequence_stage, indices[sequence_id]): test_case for sequence_id, test_case in test_cases.items()}, file_name)
+            return test_cases
+
         # 1. Extract message types
-        message_types: dict = get_protocol_message_types(protocol)
+        scheduler.add("types", lambda: get_protocol_message_types(protocol))
+
+        # Structures and test cases skip the types and sequences whose calls
+        # failed; such partial results are not checkpointed, so --resume
+        # retries the failed calls and takes the others from the manifest.
+        def all_structures(structures: dict, message_types: dict) -> bool:
+            return len(structures) == len(message_types["client_to_server_messages"])
+
+        def all_test_cases(test_cases: dict, message_sequences: dict, *_) -> bool:
+            return not message_sequences or len(test_cases) == len(message_sequences["sequences"])
 
         # 2. Extract specialized structure
-        specialized_structures: dict = get_specialized_structures(protocol, message_types)
+        scheduler.add("structures", lambda message_types: get_specialized_structures(protocol, message_types, jobs, args.batch), ["types"],
+                      complete=all_structures)
 
         # 3. Generate message sequences
-        message_sequences: dict = get_message_sequences(protocol, message_types)
-        repeated_message_sequences: dict = get_repeated_message_sequences(protocol, message_types)
+        scheduler.add("sequences", lambda message_types: get_message_sequences(protocol, message_types), ["types"])
+        scheduler.add("repeated_sequences", lambda message_types: get_repeated_message_sequences(protocol, message_types), ["types"])
 
         # 4. Generate test cases
-        seed_index = 0
-        if seed_messages:
-            test_cases = {}
-            for file_name, seed_message in zip(file_names, seed_messages):
-                structured_seed_message = get_structured_seed_message(protocol, seed_message)
-                test_cases[seed_index] = get_test_cases(protocol, message_sequences, specialized_structures, structured_seed_message)
-                seed_index += 1
-                if repeated_message_sequences:
-                    test_cases[seed_index] = get_test_cases(protocol, repeated_message_sequences, specialized_structures, structured_seed_message)
-                    seed_index += 1
-                for seed_index, test_case in test_cases.items():
-                    save_test_cases(test_case, output_dir, file_name)
+        if seed_files:
+            from LLM.structured_seed_message import get_structured_seed_message
+            # Seed stages are named after their file, so that their checkpoints
+            # do not depend on which other files are in the folder.
+            for file_name, file_path in seed_files:
+                seed_stage = f"seed_{file_name}"
+                # A seed is only read when its stage runs.
+                scheduler.add(seed_stage, lambda file_path=file_path: get_structured_seed_message(protocol, read_seed_message(file_path)),
+                              inputs=file_digest(file_path))
+                for sequence_stage in ("sequences", "repeated_sequences"):
+                    stage = f"{sequence_stage}_testcases_{file_name}"
+                    scheduler.add(stage,
+                                  lambda message_sequences, specialized_structures, structured_seed_message, stage=stage, sequence_stage=sequence_stage, file_name=file_name:
+                                      generate_test_cases(stage, sequence_stage, message_sequences, specialized_structures, structured_seed_message, file_name),
+                                  [sequence_stage, "structures", seed_stage], inputs=file_name, complete=all_test_cases)
         else:
-            test_cases = {}
-            test_cases[0] = get_test_cases(protocol, message_sequences, specialized_structures, None)
-            if repeated_message_sequences:
-                test_cases[1] = get_test_cases(protocol, repeated_message_sequences, specialized_structures, None)
-            for seed_index, test_case in test_cases.items():
-                save_test_cases(test_case, output_dir, "default")
+            for sequence_stage in ("sequences", "repeated_sequences"):
+                stage = f"{sequence_stage}_testcases"
+                scheduler.add(stage,
+                              lambda message_sequences, specialized_structures, stage=stage, sequence_stage=sequence_stage:
+                                  generate_test_cases(stage, sequence_stage, message_sequences, specialized_structures, None, "default"),
+                              [sequence_stage, "structures"], inputs="default", complete=all_test_cases)
+
+        scheduler.run()
+        if writer.duplicates:
+            print(f"Skipped {writer.duplicates} duplicate seeds")
+        if args.cmin_cmd and writer.paths:
+            from utility.cmin import minimize
+            new_seeds = set(writer.paths)
+            kept_seeds = [file_path for _, file_path in iter_seed_files(output_dir) if file_path not in new_seeds]
+            keep, redundant = minimize(args.cmin_cmd, kept_seeds, list(writer.paths))
+            redundant_dir = output_dir.rstrip("/") + "-redundant"
+            writer.move_seeds(redundant, redundant_dir)
+            print(f"Corpus minimization: kept {len(keep)} of {len(keep) + len(redundant)} new seeds, moved {len(redundant)} to {redundant_dir}")
+        print(f"Saved {writer.seeds} seeds to {output_dir}")
+        framing_report = writer.framing_report()
+        if framing_report["seeds"]:
+            print(f"Framing: {framing_report['matching']} of {framing_report['seeds']} seeds split into their messages by aflnet's {protocol} splitter")
+            os.makedirs(LLM_RESULT_DIR, exist_ok=True)
+            with open(os.path.join(LLM_RESULT_DIR, "framing_report.json"), "w") as f:
+                json.dump(framing_report, f, indent=4)
+        if cache is not None:
+            print(f"LLM response cache: {cache.hits} hits, {cache.misses} misses")
+        report_connections()
+        report_retries()
+        if checkpoint is not None and checkpoint.reused:
+            print(f"Resumed {checkpoint.reused} completed stages and calls from {checkpoint.path}")
+        if scheduler.errors:
+            print(f"Failed stages: {', '.join(scheduler.errors)}; rerun with --resume to complete the run")
+            status = 1
+        if scheduler.incomplete:
+            print(f"Incomplete stages: {', '.join(sorted(scheduler.incomplete))}; rerun with --resume to complete the run")
+            status = 1
+        if not has_seeds(output_dir):
+            print(f"No seeds in {output_dir}")
+            status = 1
 
     except Exception as e:
         print(f"Error processing protocol {protocol}: {e}")
+        # The seeds written before the failure stay in the output directory.
+        print(f"Saved {writer.seeds} seeds to {output_dir} before the failure; rerun with --resume to complete the run")
+        status = 1
+
+    finally:
+        if sampler is not None:
+            sampler.stop()
+            summary = sampler.write(args.profile)
+            for name, stage in summary["stages"].items():
+                print(f"Profile {name}: {stage['thread_seconds']:.1f}s sampled, {stage['cpu_seconds']:.2f}s CPU")
+            print(f"Wrote per-stage wall and CPU profiles to {args.profile}")
+        os.makedirs(LLM_RESULT_DIR, exist_ok=True)
+        report = metrics.write(os.path.join(LLM_RESULT_DIR, "metrics.json"), args.metrics_textfile)
+        totals = report["totals"]
+        print(f"LLM requests: {totals['requests']} in {totals['seconds']:.1f}s, {totals['prompt_tokens']} prompt and {totals['completion_tokens']} completion tokens, "
+              f"{totals['retries']} retries, {totals['failures']} failures")
+    return status
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
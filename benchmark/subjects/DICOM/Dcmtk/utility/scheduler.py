@@ -0,0 +1,104 @@
+import time
+import threading
+
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Callable, Dict, List, Optional
+from utility.metrics import metrics
+from utility import profiler
+from utility.checkpoint import checkpointed
+
+class StageScheduler:
+    """Run pipeline stages as soon as the stages they depend on have finished.
+
+    Each stage is called with the results of its dependencies, in the order
+    they were listed. A failing stage is reported and every stage that
+    depends on it is skipped; independent stages keep running. Completed
+    stages are added to the run's checkpoint manifest, keyed by the stage's
+    own inputs and the results of its dependencies, and are not run again
+    when the manifest is resumed. Stages that carry on past failed calls
+    give a complete predicate, so that their partial results are run again;
+    such stages are listed in incomplete.
+    """
+
+    def __init__(self, max_workers: int = 8):
+        self.max_workers = max(1, max_workers)
+        self.stages: Dict[str, tuple] = {}
+        self.errors: Dict[str, Exception] = {}
+        self.incomplete: List[str] = []
+        self.lock = threading.Lock()
+
+    def add(self, name: str, func: Callable, deps: List[str] = (), inputs: Any = None, complete: Optional[Callable[..., bool]] = None) -> None:
+        """inputs identifies what the stage works on besides its dependencies,
+        e.g. the protocol or a seed file. complete(result, *dependency_results)
+        tells whether the result may be checkpointed."""
+        if name in self.stages:
+            raise ValueError(f"Stage {name} is already defined")
+        self.stages[name] = (func, list(deps), inputs, complete)
+
+    def timed(self, name: str, func: Callable, ready: float, *args):
+        """Run a stage and record how long it waited for a worker and ran."""
+        started = time.monotonic()
+        _, _, inputs, complete = self.stages[name]
+        is_complete = None if complete is None else lambda result: complete(result, *args)
+        try:
+            with profiler.stage(name):
+                result = checkpointed(f"stage {name}", [inputs, list(args)], lambda: func(*args), is_complete)
+        except Exception:
+            metrics.record_stage(name, started - ready, time.monotonic() - started, "failed")
+            raise
+        status = "ok"
+        if is_complete is not None and not is_complete(result):
+            status = "incomplete"
+            with self.lock:
+                self.incomplete.append(name)
+            print(f"Stage {name} is incomplete: some of its calls failed")
+        metrics.record_stage(name, started - ready, time.monotonic() - started, status)
+        return result
+
+    def run(self) -> dict:
+        for name, (_, deps, _, _) in self.stages.items():
+            for dep in deps:
+                if dep not in self.stages:
+                    raise ValueError(f"Stage {name} depends on unknown stage {dep}")
+
+        results = {}
+        errors = {}
+        pending = dict(self.stages)
+        running = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while pending or running:
+                # Repeat until nothing changes so that skips propagate through
+                # chains of dependent stages in a single pass.
+                progress = True
+                while progress:
+                    progress = False
+                    for name, (func, deps, _, _) in list(pending.items()):
+                        failed = [dep for dep in deps if dep in errors]
+                        if failed:
+                            errors[name] = Exception(f"skipped because {failed[0]} failed")
+                            print(f"Skipping stage {name}: {failed[0]} failed")
+                            metrics.record_stage(name, 0.0, 0.0, "skipped")
+                        elif all(dep in results for dep in deps):
+                            running[executor.submit(self.timed, name, func, time.monotonic(), *[results[dep] for dep in deps])] = name
+                        else:
+                            continue
+                        del pending[name]
+                        progress = True
+
+                if not running:
+                    if pending:
+                        raise ValueError(f"Circular stage dependencies: {', '.join(pending)}")
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        results[name] = future.result()
+                    except Exception as e:
+                        errors[name] = e
+                        print(f"Error in stage {name}: {e}")
+
+        self.errors = errors
+        return results
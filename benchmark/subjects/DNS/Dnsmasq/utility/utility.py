@@ -1,85 +1,423 @@
 import os
-import json
+import hashlib
 import random
-from typing import List
-from pprint import pprint
+import shutil
+from typing import List, Callable, Iterator, Optional, Tuple
 import re
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from utility import codec, framing, profiler
 
 MODEL = "gpt-4o-mini"
 LLM_RESULT_DIR = "llm_outputs"
 TEST_MESSAGE_DIR = os.path.join(LLM_RESULT_DIR, "messages")
+PREGEN_CORPUS_DIR = "corpus"         # Seeds of a pre-generated campaign corpus, next to its llm_outputs
+PROFILE_DIR = "profile_results"     # Folded stacks of --profile, next to llm_outputs
 SEQUENCE_REPEAT = 1
 LLM_RETRY = 3
+LLM_CONCURRENCY = 8
+LLM_API_RETRY = 6                   # Retries of rate-limited or failed API requests, with backoff
+LLM_BACKOFF_BASE = 1.0              # First backoff delay in seconds, doubled on every retry
+LLM_BACKOFF_MAX = 60.0
+LLM_RPM = int(os.environ.get("STELLAFUZZ_LLM_RPM", 500))       # Requests per minute allowed by the provider, 0 for no limit
+LLM_TPM = int(os.environ.get("STELLAFUZZ_LLM_TPM", 200000))    # Tokens per minute allowed by the provider, 0 for no limit
+LLM_MAX_PROMPT_TOKENS = 100000     # Estimated prompt size above which a warning is logged
+LLM_MAX_CONNECTIONS = 64            # Size of the shared HTTP connection pool
+LLM_KEEPALIVE_EXPIRY = 60           # Seconds an idle connection is kept open
+LLM_CACHE_DIR = os.environ.get("STELLAFUZZ_CACHE_DIR")    # Shared response cache, disabled when unset
+LLM_CACHE_MAX_BYTES = 512 * 1024 * 1024
+LLM_CACHE_MAX_AGE = 30 * 24 * 3600
+LLM_BATCH_POLL_INTERVAL = float(os.environ.get("STELLAFUZZ_BATCH_POLL", 30))    # Seconds between batch status checks
+LLM_BATCH_TIMEOUT = 24 * 3600       # Batches still unfinished after this are cancelled
+LLM_ARTIFACT_FORMAT = os.environ.get("STELLAFUZZ_ARTIFACT_FORMAT", "json")    # Stage results as compact "json" or zstd-compressed "zst"
+METRICS_TEXTFILE = os.environ.get("STELLAFUZZ_METRICS_TEXTFILE", os.path.join(LLM_RESULT_DIR, "stellafuzz.prom"))    # Prometheus textfile written at exit
+CMIN_TIMEOUT = 10                   # Seconds the coverage command of corpus minimization may run per seed
+SYNC_FUZZER_ID = "stellafuzz"       # Fuzzer name under which seeds appear in an afl-fuzz sync directory
 
-def convert_message_to_binary(message: str) -> bytes:
-    if not message:
-        return b''
-    
-    parts = message.split(' ')
-    processed_parts = []
-    
-    for part in parts:
-        if part.startswith('0x'):
-            try:
-                binary_value = bytes([int(part[2:], 16)])
-                processed_parts.append((binary_value, True))
-            except ValueError:
-                processed_parts.append((part.encode(), False))
-        else:
-            processed_parts.append((part.encode(), False))
-    
-    result = bytearray()
-    for i in range(len(processed_parts)):
-        current_data, current_is_binary = processed_parts[i]
-        result.extend(current_data)
-        
-        if i < len(processed_parts) - 1:
-            next_is_binary = processed_parts[i+1][1]
-            if not current_is_binary and not next_is_binary:
-                result.extend(b' ')
-
-    return bytes(result)
-
-def save_test_cases(test_cases: dict, output_dir: str, seed_file_name: str) -> None:
-    concatnated_messages = bytearray()
-    os.makedirs(output_dir, exist_ok=True)
-    
-    idx = 1
-    for testcase in test_cases.values():
-        for sequence in testcase["sequences"]:
+def map_concurrently(func: Callable, items: list, jobs: int = LLM_CONCURRENCY) -> list:
+    """Apply func to every item with at most `jobs` calls in flight.
+
+    Results come back in the order of `items`. If func raises for an item, the
+    exception is returned in its place so one failure does not discard the rest.
+    """
+    # Worker threads are profiled as part of the stage that started them.
+    stage = profiler.current_stage()
+
+    def call(item):
+        with profiler.stage(stage):
             try:
-                for message in sequence["messages"]:   
-                    concatnated_messages += convert_message_to_binary(message["message"]) + b"\r\n"
-
-                while True:
-                    file_path = os.path.join(output_dir, f"{seed_file_name.replace('.raw', '')}_new_{idx}.raw")
-                    if not os.path.exists(file_path):
-                        break
-                    idx += 1
-                
-                with open(file_path, "wb") as f:
-                    f.write(concatnated_messages)
-                concatnated_messages = bytearray()
-                idx += 1
+                return func(item)
             except Exception as e:
-                print(f"Error: {e}")
+                return e
+
+    if jobs <= 1 or len(items) <= 1:
+        return [call(item) for item in items]
+    with ThreadPoolExecutor(max_workers=min(jobs, len(items))) as executor:
+        return list(executor.map(call, items))
+
+def convert_message_to_binary(message: str) -> bytes:
+    return codec.decode(message)
+
+def test_case_to_message_sequences(test_case: dict, protocol: Optional[str] = None) -> List[List[bytes]]:
+    """Convert every sequence of a test case into its messages, framed for protocol."""
+    sequences = []
+    for sequence in test_case["sequences"]:
+        try:
+            messages = [convert_message_to_binary(message["message"]) for message in sequence["messages"]]
+            sequences.append(framing.frame_messages(protocol, messages))
+        except Exception as e:
+            print(f"Error: {e}")
+    return sequences
+
+def test_case_to_seeds(test_case: dict, protocol: Optional[str] = None) -> List[bytes]:
+    """Convert every sequence of a test case into one seed."""
+    return [b"".join(messages) for messages in test_case_to_message_sequences(test_case, protocol)]
+
+# os.umask can only be read by setting it, which is not safe once the writer
+# threads run, so it is read once at import.
+UMASK = os.umask(0o022)
+os.umask(UMASK)
+
+def make_readable(fd: int) -> None:
+    """Give a file from tempfile.mkstemp, which is private (0600), the mode of
+    a file created with open(), so that seeds stay readable by the fuzzer
+    when they are copied into a container that runs as another user."""
+    os.fchmod(fd, 0o666 & ~UMASK)
+
+def write_atomically(file_path: str, data: bytes) -> None:
+    """Write data so that readers never see a partial file.
+
+    The temporary file starts with a dot, which afl-fuzz skips when it scans
+    sync directories. Its input directory is read without skipping dot files,
+    so nothing but seeds may be left there.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(file_path) or ".", prefix=".", suffix=".tmp")
+    make_readable(fd)
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, file_path)
+
+index_lock = threading.Lock()
+next_indices = {}
+
+def next_index(directory: str, pattern: str, start: int = 0) -> int:
+    """Return the next index for file names matching pattern in directory.
+
+    The directory is scanned once, on first use of a pattern, for the highest
+    index captured by the first group of pattern; later indices come from an
+    in-memory counter, so naming a file costs O(1) instead of one stat call
+    per existing file.
+    """
+    key = (os.path.abspath(directory), pattern)
+    with index_lock:
+        if key not in next_indices:
+            os.makedirs(directory, exist_ok=True)
+            regex = re.compile(pattern)
+            indices = [int(match.group(1)) for match in map(regex.fullmatch, os.listdir(directory)) if match]
+            next_indices[key] = max(indices, default=start - 1) + 1
+        index = next_indices[key]
+        next_indices[key] += 1
+    return index
+
+def next_file_path(directory: str, prefix: str, suffix: str, start: int = 0) -> str:
+    """Create and return <directory>/<prefix><index><suffix> with an unused index.
+
+    The file is created empty with O_EXCL, which keeps names unique even when
+    another process writes into the same directory.
+    """
+    pattern = re.escape(prefix) + r"(\d+)" + re.escape(suffix)
+    while True:
+        file_path = os.path.join(directory, f"{prefix}{next_index(directory, pattern, start)}{suffix}")
+        try:
+            os.close(os.open(file_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644))
+            return file_path
+        except FileExistsError:
+            continue
+
+def link_named(src_path: str, directory: str, name: str, suffix: str) -> str:
+    """Hard link src_path as <directory>/<name><suffix>, or as <name>-<n><suffix>
+    with the lowest free n from 2 on if that name is taken, and return the path.
+    The link fails if the name is taken, so names stay unique even when
+    another process writes into the same directory."""
+    file_path = os.path.join(directory, f"{name}{suffix}")
+    n = 2
+    while True:
+        try:
+            os.link(src_path, file_path)
+            return file_path
+        except FileExistsError:
+            file_path = os.path.join(directory, f"{name}-{n}{suffix}")
+            n += 1
+
+def write_named_file(directory: str, name: str, suffix: str, data: bytes) -> str:
+    """Write data to <directory>/<name><suffix>, or to the next free name
+    after it (see link_named), and return its path.
+
+    Unlike next_file_path, no empty placeholder is created: data goes to a
+    temporary dot file first, which is then hard linked under the new name,
+    so a failed write leaves no empty seed behind.
+    """
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".", suffix=".tmp")
+    try:
+        make_readable(fd)
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        return link_named(tmp_path, directory, name, suffix)
+    finally:
+        os.remove(tmp_path)
+
+sync_locks = {}
+
+def sync_seed(sync_dir: str, data: bytes, origin: str) -> None:
+    """Add a seed to the queue of SYNC_FUZZER_ID in an afl-fuzz sync directory,
+    where fuzzers running with -M/-S and -o sync_dir pick it up."""
+    queue_dir = os.path.join(sync_dir, SYNC_FUZZER_ID, "queue")
+    with index_lock:
+        queue_lock = sync_locks.setdefault(os.path.abspath(queue_dir), threading.Lock())
+    # afl-fuzz never imports an id below the highest one it has seen, so the
+    # seeds must appear in id order: the id is taken and the seed written
+    # under one lock. No empty placeholder here either, afl-fuzz would import
+    # it and never look at that id again.
+    with queue_lock:
+        sync_id = next_index(queue_dir, r"id:(\d{6}).*")
+        write_atomically(os.path.join(queue_dir, f"id:{sync_id:06d},orig:{origin}"), data)
+
+GENERATED_SEED = re.compile(r".+_new_.+\.raw")     # Names of the seeds written by CorpusWriter
+
+def seed_name(key) -> str:
+    """The part of a seed's file name that identifies the test case it was
+    generated for, e.g. "sequences_3" for the key ("sequences", "3")."""
+    parts = key if isinstance(key, tuple) else (key,)
+    return "_".join(re.sub(r"[^0-9A-Za-z.-]+", "-", str(part)) for part in parts)
+
+class CorpusWriter:
+    """Writes the seeds of generated test cases to output_dir.
+
+    Every test case is written exactly once, however often it is handed in.
+    A seed is named after its seed file, the key of its test case and its
+    position in the test case, e.g. seed_1_new_sequences_3_0.raw, so that
+    replaying the same LLM responses gives the same corpus file for file,
+    whatever order the test cases arrive in. Messages are framed for
+    protocol, and every seed is checked against aflnet's splitter for it;
+    seeds that aflnet would not split back into their messages are listed in
+    framing_mismatches.
+
+    With replayable_dir, every seed is also written there in aflnet's
+    replayable format, and its message boundaries to replayable_dir/regions.
+
+    With dedup, a seed whose SHA-256 matches a seed already in output_dir,
+    including the files that were there before the run, is not written. Of
+    identical seeds generated by the run, the one with the smallest name is
+    kept, however they arrive.
+    """
+
+    def __init__(self, output_dir: str, sync_dir: Optional[str] = None, protocol: Optional[str] = None, replayable_dir: Optional[str] = None,
+                 dedup: bool = True):
+        self.output_dir = output_dir
+        self.sync_dir = sync_dir
+        self.protocol = protocol
+        self.replayable_dir = replayable_dir
+        self.dedup = dedup
+        self.lock = threading.Lock()
+        self.written = set()
+        self.hashes = None          # digest -> name the seed is to be kept under, None for seeds from before the run
+        self.digest_paths = {}      # digest -> path of a seed written by the run
+        self.paths = []
+        self.seeds = 0
+        self.duplicates = 0
+        self.framing_checked = 0
+        self.framing_mismatches = []
+
+    def write(self, key, test_case: dict, seed_file_name: str) -> List[str]:
+        """Write the seeds of test_case that were not written before under the
+        same key. Returns the paths of the new seeds."""
+        paths = []
+        base_name = f"{seed_file_name.replace('.raw', '')}_new_{seed_name(key)}"
+        for index, messages in enumerate(test_case_to_message_sequences(test_case, self.protocol)):
+            seed = b"".join(messages)
+            digest = hashlib.sha256(seed).digest()
+            name = f"{base_name}_{index}"
+            with self.lock:
+                if (seed_file_name, key, index) in self.written:
+                    continue
+                self.written.add((seed_file_name, key, index))
+                if self.dedup:
+                    if self.hashes is None:
+                        self.hashes = self.existing_hashes()
+                    if digest in self.hashes:
+                        self.duplicates += 1
+                        kept = self.hashes[digest]
+                        if kept is not None and name < kept:
+                            self.hashes[digest] = name
+                            if digest in self.digest_paths:
+                                self.rename_seed(digest, name)
+                        continue
+                    self.hashes[digest] = name
+            try:
+                file_path = write_named_file(self.output_dir, name, ".raw", seed)
+            except Exception:
+                # Leave the seed to a later call.
+                with self.lock:
+                    self.written.discard((seed_file_name, key, index))
+                    if self.hashes is not None:
+                        self.hashes.pop(digest, None)
+                raise
+            if self.replayable_dir:
+                self.write_replayable(os.path.basename(file_path), messages)
+            if self.sync_dir:
+                sync_seed(self.sync_dir, seed, os.path.basename(file_path))
+            matches = framing.framing_matches(self.protocol, messages)
+            with self.lock:
+                self.seeds += 1
+                self.paths.append(file_path)
+                self.check_framing(os.path.basename(file_path), messages, matches)
+                if self.dedup:
+                    self.digest_paths[digest] = file_path
+                    if self.hashes[digest] != name:
+                        # An identical seed with a smaller name arrived meanwhile.
+                        file_path = self.rename_seed(digest, self.hashes[digest])
+            paths.append(file_path)
+        return paths
+
+    def rename_seed(self, digest: bytes, name: str) -> str:
+        """Give the seed with digest written by this run, and its replayable
+        copies, the file name of an identical seed with a smaller name.
+        Called with the lock held."""
+        old_path = self.digest_paths[digest]
+        old_name = os.path.basename(old_path)
+        file_path = link_named(old_path, self.output_dir, name, ".raw")
+        os.remove(old_path)
+        file_name = os.path.basename(file_path)
+        if self.replayable_dir:
+            for directory in (self.replayable_dir, os.path.join(self.replayable_dir, "regions")):
+                os.replace(os.path.join(directory, old_name), os.path.join(directory, file_name))
+        self.digest_paths[digest] = file_path
+        self.paths[self.paths.index(old_path)] = file_path
+        for mismatch in self.framing_mismatches:
+            if mismatch["file"] == old_name:
+                mismatch["file"] = file_name
+        return file_path
+
+    def existing_hashes(self) -> dict:
+        hashes = {}
+        if os.path.isdir(self.output_dir):
+            for _, file_path in iter_seed_files(self.output_dir):
+                with open(file_path, "rb") as f:
+                    hashes[hashlib.sha256(f.read()).digest()] = None
+        return hashes
+
+    def move_seeds(self, file_paths: List[str], target_dir: str) -> None:
+        """Move seeds written by this writer to target_dir and drop their replayable copies."""
+        os.makedirs(target_dir, exist_ok=True)
+        for file_path in file_paths:
+            file_name = os.path.basename(file_path)
+            os.replace(file_path, os.path.join(target_dir, file_name))
+            if self.replayable_dir:
+                for replay_path in (os.path.join(self.replayable_dir, file_name), os.path.join(self.replayable_dir, "regions", file_name)):
+                    if os.path.exists(replay_path):
+                        os.remove(replay_path)
+            with self.lock:
+                self.paths.remove(file_path)
+                self.seeds -= 1
+                for digest, path in list(self.digest_paths.items()):
+                    if path == file_path:
+                        del self.digest_paths[digest]
+
+    def write_replayable(self, file_name: str, messages: List[bytes]) -> None:
+        regions_dir = os.path.join(self.replayable_dir, "regions")
+        os.makedirs(regions_dir, exist_ok=True)
+        write_atomically(os.path.join(self.replayable_dir, file_name), framing.to_replayable(messages))
+        write_atomically(os.path.join(regions_dir, file_name), framing.format_regions(messages).encode("ascii"))
+
+    def check_framing(self, file_name: str, messages: List[bytes], matches: Optional[bool]) -> None:
+        """Count a seed whose framing was checked; called with the lock held."""
+        if matches is None:
+            return
+        self.framing_checked += 1
+        if not matches:
+            self.framing_mismatches.append({"file": file_name, "messages": [len(message) for message in messages],
+                                            "regions": [end - start + 1 for start, end in framing.split_requests(self.protocol, b"".join(messages))]})
+
+    def framing_report(self) -> dict:
+        with self.lock:
+            return {"protocol": self.protocol, "seeds": self.framing_checked,
+                    "matching": self.framing_checked - len(self.framing_mismatches),
+                    "mismatches": list(self.framing_mismatches)}
+
+    def write_all(self, test_cases: dict, seed_file_name: str) -> List[str]:
+        paths = []
+        for test_case_id, test_case in test_cases.items():
+            paths += self.write(test_case_id, test_case, seed_file_name)
+        return paths
+
+def save_test_cases(test_cases: dict, output_dir: str, seed_file_name: str, sync_dir: Optional[str] = None, protocol: Optional[str] = None,
+                    replayable_dir: Optional[str] = None) -> None:
+    CorpusWriter(output_dir, sync_dir, protocol, replayable_dir).write_all(test_cases, seed_file_name)
             
-def load_seed_messages(seed_messages_dir: str) -> List[str]:
-    seed_messages = []
-    file_names = []
-    for file in os.listdir(seed_messages_dir):
+def escape_seed_message(binary_content: bytes) -> str:
+    """Convert a binary seed into the readable form used in the prompts."""
+    return codec.encode(binary_content)
+
+def iter_seed_files(seed_messages_dir: str) -> Iterator[Tuple[str, str]]:
+    """Yield (file name, path) of every seed file, sorted by name. Dot files,
+    such as temporary files of the corpus writer, are skipped."""
+    for file in sorted(os.listdir(seed_messages_dir)):
+        if file.startswith("."):
+            continue
         file_path = os.path.join(seed_messages_dir, file)
+        if os.path.isfile(file_path):
+            yield file, file_path
+
+def has_seeds(directory: str) -> bool:
+    return os.path.isdir(directory) and next(iter_seed_files(directory), None) is not None
+
+def is_generated_seed(file_name: str) -> bool:
+    """Whether file_name is a seed written by CorpusWriter, e.g. by an earlier
+    run into the same folder."""
+    return GENERATED_SEED.fullmatch(file_name) is not None
+
+def read_seed_message(file_path: str) -> str:
+    with open(file_path, "rb") as f:
+        return escape_seed_message(f.read())
+
+def iter_seed_messages(seed_messages_dir: str) -> Iterator[Tuple[str, str]]:
+    """Yield (file name, readable seed) pairs in sorted order, reading each
+    file only when it is reached."""
+    for file, file_path in iter_seed_files(seed_messages_dir):
+        yield file, read_seed_message(file_path)
+
+def load_seed_messages(seed_messages_dir: str) -> Tuple[List[str], List[str]]:
+    file_names = []
+    seed_messages = []
+    for file, seed_message in iter_seed_messages(seed_messages_dir):
         file_names.append(file)
-        with open(file_path, "rb") as f:
-            binary_content = f.read()
-        
-        readable_content = ""
-        for byte in binary_content:
-            if byte in (9, 10, 13) or (32 <= byte <= 126):
-                readable_content += chr(byte)
-            else:
-               readable_content += f" 0x{byte:02x} "
-        
-        seed_messages.append(readable_content)
+        seed_messages.append(seed_message)
     return file_names, seed_messages
 
+def use_pregenerated(pregen_dir: str, output_dir: str, sample_rate: float = 1.0, sample_seed: int = 0) -> List[str]:
+    """Copy the seeds generated once per campaign in pregen_dir/corpus to
+    output_dir, and pregen_dir/llm_outputs to LLM_RESULT_DIR.
+
+    With a sample_rate below 1, only that share of the seeds is copied. The
+    sample is drawn with random.Random(sample_seed), so runs with different
+    seeds start from different but reproducible corpora. Returns the paths of
+    the copied seeds.
+    """
+    seeds = list(iter_seed_files(os.path.join(pregen_dir, PREGEN_CORPUS_DIR)))
+    count = len(seeds)
+    if sample_rate < 1 and seeds:
+        count = max(1, round(len(seeds) * sample_rate))
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    for file_name, file_path in sorted(random.Random(sample_seed).sample(seeds, count)):
+        target_path = os.path.join(output_dir, file_name)
+        if os.path.exists(target_path):
+            continue
+        shutil.copyfile(file_path, target_path)
+        paths.append(target_path)
+    llm_outputs = os.path.join(pregen_dir, LLM_RESULT_DIR)
+    if os.path.isdir(llm_outputs):
+        shutil.copytree(llm_outputs, LLM_RESULT_DIR, dirs_exist_ok=True)
+    return paths
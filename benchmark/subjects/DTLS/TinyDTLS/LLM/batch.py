@@ -0,0 +1,140 @@
+import json
+import time
+
+from typing import Any, Dict, Optional, Type
+from pydantic import BaseModel
+from utility.utility import MODEL, LLM_BATCH_POLL_INTERVAL, LLM_BATCH_TIMEOUT
+from LLM.client import get_client, call_api, save_completion
+import LLM.cache as llm_cache
+import LLM.cassette as llm_cassette
+from utility.metrics import metrics
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+BATCH_FINAL_STATES = ("completed", "failed", "expired", "cancelled")
+
+def strict_json_schema(schema: Any) -> Any:
+    """Adapt a pydantic JSON schema to the rules of strict structured outputs:
+    objects allow no additional properties and list every property as
+    required (optional fields stay nullable), and defaults are dropped."""
+    if isinstance(schema, list):
+        return [strict_json_schema(item) for item in schema]
+    if not isinstance(schema, dict):
+        return schema
+    schema = {name: strict_json_schema(value) for name, value in schema.items() if name != "default"}
+    if schema.get("type") == "object":
+        schema["additionalProperties"] = False
+        schema["required"] = list(schema.get("properties", {}))
+    return schema
+
+def response_format_param(response_format: Type[BaseModel]) -> dict:
+    """The response_format of a chat completion request whose answer must parse as response_format."""
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": response_format.__name__,
+            "schema": strict_json_schema(response_format.model_json_schema()),
+            "strict": True,
+        },
+    }
+
+class BatchJob:
+    """Independent prompts of one stage sent to the model as a single Batch API job.
+
+    Batch requests are cheaper than interactive ones and do not count against
+    the interactive rate limits, but may take hours to finish. run() returns
+    the parsed responses by request id; requests that are missing from the
+    result (already cached, replayed, failed or unparsable) are left to the
+    caller, which sends them interactively through request_completion.
+    """
+
+    def __init__(self, stage: str):
+        self.stage = stage
+        self.requests = {}
+
+    def add(self, request_id: str, prompt: str, response_format: Type[BaseModel], temperature: Optional[float] = None) -> None:
+        self.requests[request_id] = (prompt, response_format, temperature)
+
+    def run(self) -> Dict[str, BaseModel]:
+        cassette = llm_cassette.cassette
+        if cassette is not None and cassette.mode == "replay":
+            return {}
+
+        pending = {}
+        for request_id, (prompt, response_format, temperature) in self.requests.items():
+            key = llm_cache.request_key(MODEL, temperature, prompt, response_format)
+            if llm_cache.cache is not None and llm_cache.cache.contains(key):
+                continue
+            pending[request_id] = (prompt, response_format, temperature, key)
+        if not pending:
+            return {}
+
+        try:
+            return self.submit(pending)
+        except Exception as e:
+            print(f"Error processing {self.stage} batch: {e}")
+            return {}
+
+    def submit(self, pending: dict) -> Dict[str, BaseModel]:
+        lines = []
+        for request_id, (prompt, response_format, temperature, _) in pending.items():
+            body = {
+                "model": MODEL,
+                "messages": [
+                    {"role": "system", "content": "You are a helpful assistant."},
+                    {"role": "user", "content": prompt}
+                ],
+                "response_format": response_format_param(response_format),
+            }
+            if temperature is not None:
+                body["temperature"] = temperature
+            lines.append(json.dumps({"custom_id": request_id, "method": "POST", "url": BATCH_ENDPOINT, "body": body}, ensure_ascii=False))
+        data = ("\n".join(lines) + "\n").encode("utf-8")
+
+        client = get_client()
+        input_file = call_api(self.stage, lambda: client.files.create(file=(f"{self.stage}.jsonl", data), purpose="batch"))
+        batch = call_api(self.stage, lambda: client.batches.create(input_file_id=input_file.id, endpoint=BATCH_ENDPOINT, completion_window="24h"))
+        print(f"Submitted {len(pending)} {self.stage} requests as batch {batch.id}")
+
+        deadline = time.monotonic() + LLM_BATCH_TIMEOUT
+        while batch.status not in BATCH_FINAL_STATES:
+            if time.monotonic() > deadline:
+                print(f"Batch {batch.id} did not finish in {LLM_BATCH_TIMEOUT}s, cancelling it")
+                call_api(self.stage, lambda: client.batches.cancel(batch.id))
+                return {}
+            time.sleep(LLM_BATCH_POLL_INTERVAL)
+            batch = call_api(self.stage, lambda: client.batches.retrieve(batch.id))
+
+        if batch.output_file_id is None:
+            print(f"Batch {batch.id} {batch.status} without output")
+            return {}
+        output = call_api(self.stage, lambda: client.files.content(batch.output_file_id))
+
+        responses = {}
+        for line in output.text.splitlines():
+            if not line.strip():
+                continue
+            result = json.loads(line)
+            request_id = result.get("custom_id")
+            if request_id not in pending or not result.get("response") or result["response"].get("status_code") != 200:
+                continue
+            completion = result["response"]["body"]
+            _, response_format, _, key = pending[request_id]
+            save_completion(self.stage, completion, key)
+            # Batch requests have no latency of their own; the wait shows in the stage time.
+            usage = completion.get("usage") or {}
+
+            try:
+                response = response_format.model_validate_json(completion["choices"][0]["message"]["content"])
+            except Exception as e:
+                print(f"Error parsing {self.stage} batch response {request_id}: {e}")
+                metrics.record_request(self.stage, "batch", 0, usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0), failed=True)
+                continue
+            metrics.record_request(self.stage, "batch", 0, usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0))
+            if llm_cache.cache is not None:
+                llm_cache.cache.put(key, response)
+            if llm_cassette.cassette is not None:
+                llm_cassette.cassette.record(self.stage, key, response)
+            responses[request_id] = response
+
+        print(f"Batch {batch.id} {batch.status}: {len(responses)} of {len(pending)} responses")
+        return responses
@@ -1,10 +1,13 @@
 import os
-import json
 
 from typing import Optional, List
 from pydantic import BaseModel
-from openai import OpenAI
-from utility.utility import MODEL, LLM_RETRY, LLM_RESULT_DIR
+from LLM.client import request_completion
+from LLM.batch import BatchJob
+from utility.utility import LLM_RETRY, LLM_RESULT_DIR, LLM_CONCURRENCY, map_concurrently
+from utility.artifacts import save_artifact, artifact_suffix
+from utility.metrics import metrics
+from utility.checkpoint import checkpointed, completed
 
 PROTOCOL_SPECIALIZED_STRUCTURE_OUTPUT_DIR = "protocol_specialized_structure_results"
 
@@ -89,66 +92,63 @@ Please produce the final JSON output accordingly, strictly following the above i
 """
 
 def using_llm(prompt: str) -> StructuredOutput:
-    client = OpenAI()
     try:
-        completion = client.beta.chat.completions.parse(
-            model=MODEL,
-            temperature=0.1,
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant."},
-                {"role": "user", "content": prompt}
-            ],
-            response_format=StructuredOutput,
-            timeout=90
-        )
-        response = completion.choices[0].message.parsed
-
-        index = 0
-        os.makedirs(os.path.join(LLM_RESULT_DIR, "2_specialized_structures"), exist_ok=True)
-        while os.path.exists(os.path.join(LLM_RESULT_DIR, "2_specialized_structures", f"response_{index}.json")):
-            index += 1
-        protocol_file = os.path.join(LLM_RESULT_DIR, "2_specialized_structures", f"response_{index}.json")
-        with open(protocol_file, "w", encoding="utf-8") as f:
-            json.dump(completion.model_dump(), f, indent=4, ensure_ascii=False)
-        return response
+        return request_completion(prompt, StructuredOutput, "2_specialized_structures", temperature=0.1, timeout=90)
     except Exception as e:
         print(f"Error processing protocol: {e}")
         return None
 
-def get_specialized_structure(protocol: str, message_type: dict) -> None:
-    prompt = PROTOCOL_SPECIALIZED_STRUCTURE_PROMPT.replace("[PROTOCOL]", protocol)\
-                                                  .replace("[TYPE]", message_type["name"])\
-                                                  .replace("[CODE]", message_type["code"] if message_type["code"] else "NULL")\
-                                                  .replace("[DESCRIPTION]", message_type["description"])
-    
-    for _ in range(LLM_RETRY):
-        response = using_llm(prompt)
-        if response is not None:
-            break
+def build_specialized_structure_prompt(protocol: str, message_type: dict) -> str:
+    return PROTOCOL_SPECIALIZED_STRUCTURE_PROMPT.replace("[PROTOCOL]", protocol)\
+                                                .replace("[TYPE]", message_type["name"])\
+                                                .replace("[CODE]", message_type["code"] if message_type["code"] else "NULL")\
+                                                .replace("[DESCRIPTION]", message_type["description"])
+
+def get_specialized_structure(protocol: str, message_type: dict, response: Optional[StructuredOutput] = None) -> None:
+    # A response obtained from a batch job skips the interactive request.
+    if response is None:
+        prompt = build_specialized_structure_prompt(protocol, message_type)
+        with metrics.message_type(message_type["name"]):
+            for _ in range(LLM_RETRY):
+                response = using_llm(prompt)
+                if response is not None:
+                    break
 
     if response is None:
         raise Exception(f"Failed to generate specialized structure for {message_type['name']} in {protocol}")
 
     return response.model_dump()
 
-def get_specialized_structures(protocol: str, message_types: dict) -> None:
+def get_specialized_structures(protocol: str, message_types: dict, jobs: int = LLM_CONCURRENCY, batch: bool = False) -> None:
     structures = {}
-
-    for message_type in message_types["client_to_server_messages"]:
-        try:
-            structures[message_type["name"]] = get_specialized_structure(protocol, message_type)
-        except Exception as e:
-            print(f"Error processing message type {message_type['name']} in {protocol}: {e}")
+    client_types = message_types["client_to_server_messages"]
+
+    batched = {}
+    if batch:
+        job = BatchJob("2_specialized_structures")
+        for index, message_type in enumerate(client_types):
+            if completed("2_specialized_structures", [protocol, message_type]):
+                continue
+            job.add(str(index), build_specialized_structure_prompt(protocol, message_type), StructuredOutput, temperature=0.1)
+        batched = job.run()
+
+    # Each type is an independent request, so fan them out and collect the
+    # results in the original order. Types completed by a resumed run are
+    # taken from the checkpoint manifest.
+    def process(item: tuple) -> dict:
+        index, message_type = item
+        return checkpointed("2_specialized_structures", [protocol, message_type],
+                            lambda: get_specialized_structure(protocol, message_type, batched.get(str(index))))
+
+    results = map_concurrently(process, list(enumerate(client_types)), jobs)
+    for message_type, result in zip(client_types, results):
+        if isinstance(result, Exception):
+            print(f"Error processing message type {message_type['name']} in {protocol}: {result}")
+            continue
+        structures[message_type["name"]] = result
     
-    os.makedirs(PROTOCOL_SPECIALIZED_STRUCTURE_OUTPUT_DIR, exist_ok=True)
-    file_path = os.path.join(PROTOCOL_SPECIALIZED_STRUCTURE_OUTPUT_DIR, f"{protocol.lower()}_specialized_structures.json")
-    with open(file_path, "w", encoding="utf-8") as f:
-        json.dump(structures, f, indent=4, ensure_ascii=False)    
+    file_path = save_artifact(os.path.join(LLM_RESULT_DIR, f"2_{protocol.lower()}_specialized_structures{artifact_suffix()}"), structures,
+                              [os.path.join(PROTOCOL_SPECIALIZED_STRUCTURE_OUTPUT_DIR, f"{protocol.lower()}_specialized_structures{artifact_suffix()}")])
     print(f"Saved results for {protocol} to {file_path}")
 
-    os.makedirs(LLM_RESULT_DIR, exist_ok=True)
-    protocol_file = os.path.join(LLM_RESULT_DIR, f"2_{protocol.lower()}_specialized_structures.json")
-    with open(protocol_file, "w", encoding="utf-8") as f:
-        json.dump(structures, f, indent=4, ensure_ascii=False)
-
     return structures
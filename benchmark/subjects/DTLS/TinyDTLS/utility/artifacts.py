@@ -0,0 +1,89 @@
+import os
+import json
+import shutil
+import threading
+
+from typing import Any, Iterator, Iterable
+from utility.utility import LLM_ARTIFACT_FORMAT, write_atomically
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Results of the pipeline are serialized once, as compact JSON, and written
+# to a single file; the legacy *_results/ paths are hard links to the same
+# file. With the "zst" format every artifact is compressed with zstandard and
+# gets the suffix ".json.zst". Raw completions are appended as lines of one
+# JSONL file per stage instead of one file per call.
+
+ARTIFACT_FORMATS = ("json", "zst")
+ZSTD_LEVEL = 3
+
+artifact_format = "json"
+append_lock = threading.Lock()
+
+def configure_artifacts(fmt: str = LLM_ARTIFACT_FORMAT) -> str:
+    """Select how artifacts are written; zst falls back to json without zstandard."""
+    global artifact_format
+    if fmt not in ARTIFACT_FORMATS:
+        raise Exception(f"Unknown artifact format {fmt}, expected one of {', '.join(ARTIFACT_FORMATS)}")
+    if fmt == "zst" and zstandard is None:
+        print("zstandard is not installed, writing uncompressed artifacts")
+        fmt = "json"
+    artifact_format = fmt
+    return artifact_format
+
+def artifact_suffix() -> str:
+    return ".json.zst" if artifact_format == "zst" else ".json"
+
+def serialize(obj: Any) -> bytes:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def compress(data: bytes) -> bytes:
+    return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data) if artifact_format == "zst" else data
+
+def save_artifact(file_path: str, obj: Any, legacy_paths: Iterable[str] = ()) -> str:
+    """Write obj to file_path and link every legacy path to it. Paths are
+    expected to end with artifact_suffix(). Returns file_path."""
+    os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+    write_atomically(file_path, compress(serialize(obj)))
+    for legacy_path in legacy_paths:
+        os.makedirs(os.path.dirname(legacy_path) or ".", exist_ok=True)
+        if os.path.lexists(legacy_path):
+            os.remove(legacy_path)
+        try:
+            os.link(file_path, legacy_path)
+        except OSError:
+            # Another file system or no hard links: fall back to a copy.
+            shutil.copyfile(file_path, legacy_path)
+    return file_path
+
+def append_artifact(file_path: str, obj: Any) -> str:
+    """Append obj as one line to the JSONL file file_path (+ ".zst" when compressed)."""
+    if artifact_format == "zst":
+        file_path += ".zst"
+    os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+    # Each line is its own zstd frame, so the file stays appendable.
+    data = compress(serialize(obj) + b"\n")
+    with append_lock:
+        with open(file_path, "ab") as f:
+            f.write(data)
+    return file_path
+
+def read_bytes(file_path: str) -> bytes:
+    with open(file_path, "rb") as f:
+        if not file_path.endswith(".zst"):
+            return f.read()
+        if zstandard is None:
+            raise Exception(f"zstandard is required to read {file_path}")
+        with zstandard.ZstdDecompressor().stream_reader(f, read_across_frames=True) as reader:
+            return reader.read()
+
+def load_artifact(file_path: str) -> Any:
+    return json.loads(read_bytes(file_path))
+
+def iter_artifact_lines(file_path: str) -> Iterator[Any]:
+    for line in read_bytes(file_path).splitlines():
+        if line.strip():
+            yield json.loads(line)
@@ -0,0 +1,102 @@
+import os
+import json
+import hashlib
+import threading
+
+from typing import Any, Callable, Optional
+
+# The manifest of a run lists every completed pipeline stage and every
+# completed per-type and per-sequence LLM call, keyed by a hash of its name
+# and inputs, together with its result. Entries are appended as they complete,
+# so a run that fails or is killed keeps everything it already paid for; with
+# --resume the next run reuses those results and only does what is missing.
+# Changed inputs (another protocol or model, an edited seed, a different
+# structure for a type) give another key and are generated again. Only the
+# results of an earlier run are reused: within a run, every call is made.
+#
+# The manifest is kept out of the output directory, which afl-fuzz reads as
+# its input directory and would queue the manifest as a seed.
+
+def input_key(name: str, inputs: Any) -> str:
+    data = json.dumps([name, inputs], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+def file_digest(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+class Checkpoint:
+    def __init__(self, path: str, resume: bool = False, context: Any = None):
+        self.path = path
+        self.context = context
+        self.lock = threading.Lock()
+        self.results = {}
+        self.reused = 0
+        self.recorded = 0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        if resume and os.path.exists(self.path):
+            self.load()
+        elif os.path.exists(self.path):
+            # A run without --resume starts a new manifest.
+            os.remove(self.path)
+
+    def load(self) -> None:
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # The last line of a killed run may be cut off.
+                    continue
+                self.results[entry["key"]] = entry["result"]
+        print(f"Resuming from {self.path}: {len(self.results)} completed stages and calls")
+
+    def key(self, name: str, inputs: Any) -> str:
+        return input_key(name, [self.context, inputs])
+
+    def completed(self, name: str, inputs: Any) -> bool:
+        return self.key(name, inputs) in self.results
+
+    def record(self, name: str, inputs: Any, result: Any) -> None:
+        key = self.key(name, inputs)
+        line = json.dumps({"name": name, "key": key, "result": result}, ensure_ascii=False)
+        with self.lock:
+            self.recorded += 1
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+    def run(self, name: str, inputs: Any, func: Callable[[], Any], complete: Optional[Callable[[Any], bool]] = None) -> Any:
+        key = self.key(name, inputs)
+        with self.lock:
+            if key in self.results:
+                self.reused += 1
+                return self.results[key]
+        result = func()
+        if complete is None or complete(result):
+            self.record(name, inputs, result)
+        return result
+
+checkpoint: Optional[Checkpoint] = None
+
+def configure_checkpoint(path: Optional[str], resume: bool = False, context: Any = None) -> Optional[Checkpoint]:
+    """Keep the manifest of this run in the file path, or disable it when path is empty."""
+    global checkpoint
+    checkpoint = Checkpoint(path, resume, context) if path else None
+    return checkpoint
+
+def checkpointed(name: str, inputs: Any, func: Callable[[], Any], complete: Optional[Callable[[Any], bool]] = None) -> Any:
+    """Return the result of name(inputs) completed by the resumed run, or run func and add it to the manifest.
+
+    A result for which complete(result) is false, e.g. one that lacks the
+    parts whose calls failed, is returned but not added, so that a resumed
+    run calls func again.
+    """
+    if checkpoint is None:
+        return func()
+    return checkpoint.run(name, inputs, func, complete)
+
+def completed(name: str, inputs: Any) -> bool:
+    return checkpoint is not None and checkpoint.completed(name, inputs)
@@ -11,6 +11,17 @@ strstr() {
   return 0
 }
 
+#Generate the stellafuzz corpus and llm_outputs once per campaign into the folder OUTDIR
+#(see profuzzbench_pregen_stellafuzz.sh); OPTIONS are passed on to stellafuzz.py
+if [ $FUZZER = "stellafuzz-pregen" ]; then
+  pip install pydantic openai
+  cd ${WORKDIR}
+  python3 stellafuzz.py -o ${OUTDIR}/corpus -p FTP -s ${WORKDIR}/in-ftp $OPTIONS
+  STATUS=$?
+  cp -r ${WORKDIR}/llm_outputs ${OUTDIR}/llm_outputs
+  exit $STATUS
+fi
+
 #Commands for afl-based fuzzers (e.g., aflnet, aflnwe)
 if $(strstr $FUZZER "afl") || $(strstr $FUZZER "llm") || $(strstr $FUZZER "stellafuzz"); then
 
@@ -24,9 +35,14 @@ if $(strstr $FUZZER "afl") || $(strstr $FUZZER "llm") || $(strstr $FUZZER "stell
 
   #Step-1. Do Fuzzing
   if [ $FUZZER = "stellafuzz" ]; then
-    pip install pydantic openai
     cd ${WORKDIR}
-    python3 stellafuzz.py -o ${WORKDIR}/in-ftp -p FTP -s ${WORKDIR}/in-ftp
+    if [ -d "${STELLAFUZZ_PREGEN_DIR}" ]; then
+      #sample the corpus generated once per campaign (profuzzbench_pregen_stellafuzz.sh) instead of running the LLM pipeline again
+      python3 stellafuzz.py -o ${WORKDIR}/in-ftp -p FTP --pregenerated ${STELLAFUZZ_PREGEN_DIR} --sample_rate ${STELLAFUZZ_SAMPLE_RATE:-1} --sample_seed ${STELLAFUZZ_SAMPLE_SEED:-0}
+    else
+      pip install pydantic openai
+      python3 stellafuzz.py -o ${WORKDIR}/in-ftp -p FTP -s ${WORKDIR}/in-ftp
+    fi
   fi
   #Move to fuzzing folder
   cd $WORKDIR/${TARGET_DIR}/Source/Release
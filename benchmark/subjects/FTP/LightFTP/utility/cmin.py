@@ -0,0 +1,77 @@
+import os
+import shlex
+import tempfile
+import subprocess
+
+from collections import Counter
+from typing import Dict, FrozenSet, List, Optional, Tuple
+from utility.utility import CMIN_TIMEOUT
+
+# afl-cmin style minimization of the generated seeds.
+#
+# The coverage of a seed comes from a shell command in which {seed} is
+# replaced by the path of the seed and {map} by a file the command may write
+# its result to; otherwise its standard output is used. Every non-empty line
+# of the result is one coverage element, e.g. the "edge:hitcount" lines of
+# afl-showmap, or "file:line" lines from gcov for network servers, where
+# afl-showmap cannot deliver the input.
+
+def seed_coverage(command: str, seed_path: str) -> Optional[FrozenSet[str]]:
+    """Coverage elements of one seed, or None if the command failed to produce any."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        map_path = os.path.join(tmp_dir, "map")
+        cmd = command.replace("{seed}", shlex.quote(seed_path)).replace("{map}", shlex.quote(map_path))
+        try:
+            # afl-showmap exits with a non-zero status for crashes and hangs,
+            # which still have coverage, so the status is not checked.
+            result = subprocess.run(cmd, shell=True, capture_output=True, timeout=CMIN_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            print(f"Coverage command timed out on {seed_path}")
+            return None
+        if "{map}" in command:
+            if not os.path.exists(map_path):
+                return None
+            with open(map_path, "rb") as f:
+                output = f.read()
+        else:
+            output = result.stdout
+    coverage = frozenset(line.strip().decode("utf-8", "replace") for line in output.splitlines() if line.strip())
+    return coverage or None
+
+def minimize(command: str, kept_paths: List[str], candidate_paths: List[str]) -> Tuple[List[str], List[str]]:
+    """Split candidate_paths into the seeds to keep and the redundant ones.
+
+    kept_paths are never removed, but what they cover needs no other seed.
+    Like afl-cmin, the rarest element that is not covered yet is taken first
+    and covered by the smallest candidate that has it. Candidates whose
+    coverage is unknown are kept.
+    """
+    covered = set()
+    for path in kept_paths:
+        covered |= seed_coverage(command, path) or frozenset()
+
+    coverage: Dict[str, FrozenSet[str]] = {}
+    keep = []
+    for path in candidate_paths:
+        elements = seed_coverage(command, path)
+        if elements is None:
+            keep.append(path)
+        else:
+            coverage[path] = elements
+
+    counts = Counter(element for elements in coverage.values() for element in elements)
+    smallest = {}
+    for path in sorted(coverage, key=lambda path: (os.path.getsize(path), path)):
+        for element in coverage[path]:
+            smallest.setdefault(element, path)
+
+    selected = set()
+    for element in sorted(counts, key=lambda element: (counts[element], element)):
+        if element in covered:
+            continue
+        selected.add(smallest[element])
+        covered |= coverage[smallest[element]]
+
+    keep += [path for path in candidate_paths if path in selected]
+    redundant = [path for path in candidate_paths if path in coverage and path not in selected]
+    return keep, redundant
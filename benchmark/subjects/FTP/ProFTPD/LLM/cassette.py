@@ -0,0 +1,103 @@
+import os
+import re
+import json
+import threading
+
+from collections import defaultdict, deque
+from typing import Optional, Type
+from pydantic import BaseModel
+from utility.artifacts import iter_artifact_lines, load_artifact
+
+class Cassette:
+    """Recorded LLM traffic that lets the pipeline run without the network.
+
+    In record mode every response is appended to a JSONL file together with
+    its stage and request key. In replay mode responses are served from such
+    a file by request key, and a request without a recorded response fails.
+    A previous run's llm_outputs directory can be replayed as well, matched
+    by the request key stored with every completion. Completions of older
+    runs (response_<index>.json, or responses.jsonl without keys) cannot be
+    matched; they are handed out per stage in the order they were written.
+    """
+
+    def __init__(self, mode: str, path: str):
+        self.mode = mode
+        self.path = path
+        self.lock = threading.Lock()
+        self.by_key = defaultdict(deque)
+        self.by_stage = defaultdict(deque)
+        if mode == "replay":
+            if os.path.isdir(path):
+                self.load_llm_outputs(path)
+            else:
+                self.load_cassette(path)
+        elif mode == "record":
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+    def load_cassette(self, path: str) -> None:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                self.by_key[entry["key"]].append(entry["response"])
+
+    def load_llm_outputs(self, path: str) -> None:
+        for stage in sorted(os.listdir(path)):
+            stage_dir = os.path.join(path, stage)
+            if not os.path.isdir(stage_dir):
+                continue
+            completions = []
+            for name in ("responses.jsonl", "responses.jsonl.zst"):
+                if os.path.exists(os.path.join(stage_dir, name)):
+                    completions += iter_artifact_lines(os.path.join(stage_dir, name))
+            indexed = []
+            for name in os.listdir(stage_dir):
+                match = re.fullmatch(r"response_(\d+)\.json", name)
+                if match:
+                    indexed.append((int(match.group(1)), name))
+            for _, name in sorted(indexed):
+                completions.append(load_artifact(os.path.join(stage_dir, name)))
+            for completion in completions:
+                message = completion["choices"][0]["message"]
+                response = message.get("parsed")
+                if response is None and message.get("content"):
+                    response = json.loads(message["content"])
+                if response is None:
+                    continue
+                if completion.get("request_key"):
+                    self.by_key[completion["request_key"]].append(response)
+                else:
+                    self.by_stage[stage].append(response)
+
+    def replay(self, stage: str, key: str, response_format: Type[BaseModel]) -> BaseModel:
+        with self.lock:
+            responses = self.by_key.get(key)
+            if not responses:
+                # Only completions recorded without a key are served by stage.
+                responses = self.by_stage.get(stage)
+            if not responses:
+                raise Exception(f"No recorded response for this {stage} request in {self.path}")
+            # The last recording of a request keeps being served once the
+            # earlier ones are used up, so repeated prompts stay answerable.
+            response = responses.popleft() if len(responses) > 1 else responses[0]
+        return response_format.model_validate(response)
+
+    def record(self, stage: str, key: str, response: BaseModel) -> None:
+        entry = {"stage": stage, "key": key, "response": response.model_dump()}
+        line = json.dumps(entry, ensure_ascii=False)
+        with self.lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+cassette: Optional[Cassette] = None
+
+def configure_cassette(mode: str = "live", path: Optional[str] = None) -> Optional[Cassette]:
+    """Select live, record or replay mode for all LLM requests."""
+    global cassette
+    if mode not in ("live", "record", "replay"):
+        raise ValueError(f"Unknown LLM mode {mode}")
+    cassette = Cassette(mode, path) if mode != "live" else None
+    return cassette
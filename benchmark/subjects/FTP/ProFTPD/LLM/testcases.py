@@ -1,10 +1,10 @@
-import os
-import json
-
-from typing import Optional, List
+from typing import Callable, Optional, List
 from pydantic import BaseModel
-from openai import OpenAI
-from utility.utility import MODEL, LLM_RETRY, LLM_RESULT_DIR, SEQUENCE_REPEAT
+from LLM.client import request_completion
+from LLM.batch import BatchJob
+from utility.utility import LLM_RETRY, LLM_RESULT_DIR, SEQUENCE_REPEAT, LLM_CONCURRENCY, map_concurrently, next_file_path
+from utility.artifacts import save_artifact, artifact_suffix
+from utility.checkpoint import checkpointed, completed
 
 TESTCASE_OUTPUT_DIR = "testcase_results"
 
@@ -130,42 +130,40 @@ Please generate multiple valid messages for [PROTOCOL] based on the above instru
 
 
 def using_llm(prompt: str) -> TestCase:
-    client = OpenAI()
     try:
-        completion = client.beta.chat.completions.parse(
-            model=MODEL,
-            # temperature=0.7,
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant."},
-                {"role": "user", "content": prompt}
-            ],
-            response_format=TestCase,
-            timeout=30
-        )
-        response = completion.choices[0].message.parsed
-
-        index = 0
-        os.makedirs(os.path.join(LLM_RESULT_DIR, "6_testcases"), exist_ok=True)
-        while os.path.exists(os.path.join(LLM_RESULT_DIR, "6_testcases", f"response_{index}.json")):
-            index += 1
-        protocol_file = os.path.join(LLM_RESULT_DIR, "6_testcases", f"response_{index}.json")
-        with open(protocol_file, "w", encoding="utf-8") as f:
-            json.dump(completion.model_dump(), f, indent=4, ensure_ascii=False)
-        return response
+        return request_completion(prompt, TestCase, "6_testcases", timeout=30)
     except Exception as e:
         print(f"Error processing protocol: {e}")
         return None
 
-def get_test_case(protocol: str, type_sequence: List[str], specialized_structure: dict, seed_message: str) -> None:
+def format_fields(fields: List[dict]) -> str:
+    """One line per field instead of the repr of the field dicts, which
+    repeats every key and spells out the fields that are None."""
+    lines = []
+    for field in fields:
+        attributes = [field.get("data_type") or "unknown"]
+        if field.get("fixed_byte_length") is not None:
+            attributes.append(f"{field['fixed_byte_length']} bytes")
+        line = f"  - {field.get('name')} ({', '.join(attributes)}): {field.get('description', '')}"
+        if field.get("details"):
+            line += f"; {field['details']}"
+        lines.append(line)
+    return "\n".join(lines)
+
+def build_test_case_prompt(protocol: str, type_sequence: List[str], specialized_structure: dict, seed_message: str) -> str:
     sequence = ""
     structure = ""
+    # Each type is described once, however often it occurs in the sequence.
     for i, type in enumerate(type_sequence):
         sequence += f"{i+1}. {type}\n"
+    for type in dict.fromkeys(type_sequence):
         structure += f"""\
-{type}\n\
-- Code: {specialized_structure[type]['code']}\n\
-- Description: {specialized_structure[type]['type_description']}\n\
-- Fields: {specialized_structure[type]['fields']}\n\n
+{type}
+- Code: {specialized_structure[type]['code']}
+- Description: {specialized_structure[type]['type_description']}
+- Fields:
+{format_fields(specialized_structure[type]['fields'])}
+
 """
     sequence = sequence.strip()
     structure = structure.strip()
@@ -175,50 +173,78 @@ def get_test_case(protocol: str, type_sequence: List[str], specialized_structure
     else:
         seed_message = ""
     
-    prompt = MESSAGE_PROMPT.replace("[PROTOCOL]", protocol)\
-                           .replace("[SEQUENCE]", sequence)\
-                           .replace("[STRUCTURE]", structure)\
-                           .replace("[NUMBER]", str(SEQUENCE_REPEAT))\
-                           .replace("[SEED_MESSAGE]", seed_message)
-
-    
-    for _ in range(LLM_RETRY):
-        response = using_llm(prompt)
-        if response is not None:
-            break
+    return MESSAGE_PROMPT.replace("[PROTOCOL]", protocol)\
+                         .replace("[SEQUENCE]", sequence)\
+                         .replace("[STRUCTURE]", structure)\
+                         .replace("[NUMBER]", str(SEQUENCE_REPEAT))\
+                         .replace("[SEED_MESSAGE]", seed_message)
+
+def get_test_case(protocol: str, type_sequence: List[str], specialized_structure: dict, seed_message: str, response: Optional[TestCase] = None) -> None:
+    # A response obtained from a batch job skips the interactive request.
+    if response is None:
+        prompt = build_test_case_prompt(protocol, type_sequence, specialized_structure, seed_message)
+        for _ in range(LLM_RETRY):
+            response = using_llm(prompt)
+            if response is not None:
+                break
 
     if response is None:
         raise Exception(f"Failed to generate message for {specialized_structure['message_type']} in {protocol}")
 
     return response.model_dump()
 
-def get_test_cases(protocol: str, message_sequences: dict, specialized_structures: dict, seed_message: str) -> None:
+def test_case_inputs(protocol: str, stage: Optional[str], index: int, sequence: dict, specialized_structures: dict, seed_message: str) -> list:
+    """What a test case depends on, as the key of its checkpoint: only the
+    structures of the types in its sequence count. The stage, position and id
+    of the sequence keep sequences with the same types apart, so each of them
+    gets its own test case."""
+    type_sequence = sequence["type_sequence"]
+    return [protocol, stage, index, sequence["sequenceId"], type_sequence, {type: specialized_structures.get(type) for type in type_sequence}, seed_message]
+
+def get_test_cases(protocol: str, message_sequences: dict, specialized_structures: dict, seed_message: str, jobs: int = LLM_CONCURRENCY, batch: bool = False,
+                   on_result: Optional[Callable[[str, dict], None]] = None, stage: Optional[str] = None) -> None:
+    """Generate a test case per message sequence.
+
+    on_result(sequence_id, test_case) is called from the worker as soon as a
+    test case is available, before the remaining sequences are done. stage
+    names the pipeline stage in the checkpoint keys of the test cases.
+    """
     test_cases = {}
-    for sequence in message_sequences["sequences"]:
-        try:
-            print(f"Processing message sequence: {sequence['sequenceId']}")
-            test_cases[sequence["sequenceId"]] = get_test_case(protocol, sequence["type_sequence"], specialized_structures, seed_message)
-        except Exception as e:
-            print(f"Error processing message sequence {sequence['sequenceId']} in {protocol}: {e}")
+    sequences = message_sequences["sequences"]
+
+    batched = {}
+    if batch:
+        job = BatchJob("6_testcases")
+        for index, sequence in enumerate(sequences):
+            if completed("6_testcases", test_case_inputs(protocol, stage, index, sequence, specialized_structures, seed_message)):
+                continue
+            try:
+                job.add(str(index), build_test_case_prompt(protocol, sequence["type_sequence"], specialized_structures, seed_message), TestCase)
+            except KeyError:
+                # Unknown types fail again, and are reported, in get_test_case.
+                continue
+        batched = job.run()
+
+    def process(item: tuple) -> dict:
+        index, sequence = item
+        print(f"Processing message sequence: {sequence['sequenceId']}")
+        test_case = checkpointed("6_testcases", test_case_inputs(protocol, stage, index, sequence, specialized_structures, seed_message),
+                                 lambda: get_test_case(protocol, sequence["type_sequence"], specialized_structures, seed_message, batched.get(str(index))))
+        if on_result is not None:
+            try:
+                on_result(sequence["sequenceId"], test_case)
+            except Exception as e:
+                print(f"Error handling test case {sequence['sequenceId']} in {protocol}: {e}")
+        return test_case
+
+    for sequence, result in zip(sequences, map_concurrently(process, list(enumerate(sequences)), jobs)):
+        if isinstance(result, Exception):
+            print(f"Error processing message sequence {sequence['sequenceId']} in {protocol}: {result}")
+            continue
+        test_cases[sequence["sequenceId"]] = result
     
-    os.makedirs(TESTCASE_OUTPUT_DIR, exist_ok=True)
-    idx = 1
-    file_path = os.path.join(TESTCASE_OUTPUT_DIR, f"{protocol.lower()}_testcases_{idx}.json")
-    while os.path.exists(file_path):
-        idx += 1
-        file_path = os.path.join(TESTCASE_OUTPUT_DIR, f"{protocol.lower()}_testcases_{idx}.json")
-    with open(file_path, "w", encoding="utf-8") as f:
-        json.dump(test_cases, f, indent=4, ensure_ascii=False)
-    print(f"Saved results for {protocol} to {file_path}")
-
-    os.makedirs(LLM_RESULT_DIR, exist_ok=True)
-    idx = 1
-    file_path = os.path.join(LLM_RESULT_DIR, f"4_{protocol.lower()}_testcases_{idx}.json")
-    while os.path.exists(file_path):
-        idx += 1
-        file_path = os.path.join(LLM_RESULT_DIR, f"4_{protocol.lower()}_testcases_{idx}.json")
-    with open(file_path, "w", encoding="utf-8") as f:
-        json.dump(test_cases, f, indent=4, ensure_ascii=False)
+    file_path = save_artifact(next_file_path(LLM_RESULT_DIR, f"4_{protocol.lower()}_testcases_", artifact_suffix(), start=1), test_cases,
+                              [next_file_path(TESTCASE_OUTPUT_DIR, f"{protocol.lower()}_testcases_", artifact_suffix(), start=1)])
     print(f"Saved results for {protocol} to {file_path}")
 
     return test_cases
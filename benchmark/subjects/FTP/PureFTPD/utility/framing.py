@@ -0,0 +1,319 @@
+import struct
+
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Every generated message is framed the way the protocol delimits requests on
+# the wire, so that a seed can be split back into its messages by the
+# extract_requests_* function that aflnet uses for the protocol (-P). The
+# splitters below are ports of those functions from aflnet.c, including their
+# quirks, and are used to check the framing of every seed.
+
+Region = Tuple[int, int]    # first and last byte of a request, as in aflnet's region_t
+
+#Framers
+def frame_line(message: bytes, index: int) -> bytes:
+    """Line based requests (FTP, SMTP, the SSH identification) end with exactly one CRLF."""
+    return message.rstrip(b"\r\n") + b"\r\n"
+
+def frame_header_block(message: bytes, index: int) -> bytes:
+    """HTTP-like requests (HTTP, DAAP, RTSP, SIP) end with an empty line after the headers."""
+    if b"\r\n\r\n" in message:
+        return message
+    return message.rstrip(b"\r\n") + b"\r\n\r\n"
+
+def frame_raw(message: bytes, index: int) -> bytes:
+    """Datagram protocols (DNS over UDP) send the message as it is."""
+    return message
+
+def frame_ssh(message: bytes, index: int) -> bytes:
+    # Binary packets carry their own length; only the identification is a line.
+    if message.startswith(b"SSH-"):
+        return frame_line(message, index)
+    return message
+
+def records_consistent(message: bytes, header_size: int, length_of: Callable[[bytes, int], int]) -> bool:
+    """True if message is a chain of records whose length fields add up exactly."""
+    offset = 0
+    while offset < len(message):
+        if offset + header_size > len(message):
+            return False
+        offset += header_size + length_of(message, offset)
+    return offset == len(message) and len(message) > 0
+
+def tls_length(message: bytes, offset: int) -> int:
+    return struct.unpack_from(">H", message, offset + 3)[0]
+
+def frame_tls(message: bytes, index: int) -> bytes:
+    """TLS records: fix the length of a single record, or wrap a bare handshake
+    message into a handshake record."""
+    if not message or records_consistent(message, 5, tls_length):
+        return message
+    if len(message) >= 5 and 0x14 <= message[0] <= 0x18 and message[1] == 0x03:
+        if len(message) - 5 <= 0xFFFF:
+            return message[:3] + struct.pack(">H", len(message) - 5) + message[5:]
+        return message
+    if len(message) <= 0xFFFF:
+        return b"\x16\x03\x01" + struct.pack(">H", len(message)) + message
+    return message
+
+def dtls_length(message: bytes, offset: int) -> int:
+    return struct.unpack_from(">H", message, offset + 11)[0]
+
+def frame_dtls12(message: bytes, index: int) -> bytes:
+    """DTLS 1.2 records: fix the length of a single record, or wrap a bare
+    handshake message into a handshake record with sequence number index."""
+    if not message or records_consistent(message, 13, dtls_length):
+        return message
+    if len(message) >= 13 and 0x14 <= message[0] <= 0x18 and message[1:3] == b"\xfe\xfd":
+        if len(message) - 13 <= 0xFFFF:
+            return message[:11] + struct.pack(">H", len(message) - 13) + message[13:]
+        return message
+    if len(message) <= 0xFFFF:
+        return b"\x16\xfe\xfd\x00\x00" + index.to_bytes(6, "big") + struct.pack(">H", len(message)) + message
+    return message
+
+def dicom_length(message: bytes, offset: int) -> int:
+    return struct.unpack_from(">I", message, offset + 2)[0]
+
+def frame_dicom(message: bytes, index: int) -> bytes:
+    """DICOM PDUs: fix the PDU length of a single PDU."""
+    if not message or records_consistent(message, 6, dicom_length):
+        return message
+    if len(message) >= 6 and 0x01 <= message[0] <= 0x07:
+        return message[:2] + struct.pack(">I", len(message) - 6) + message[6:]
+    return message
+
+def frame_legacy(message: bytes, index: int) -> bytes:
+    return message + b"\r\n"
+
+#Ports of aflnet's extract_requests_* functions
+def split_terminated(buf: bytes, terminator: bytes, min_count: int) -> List[Region]:
+    regions = []
+    mem_count = 0
+    cur_start = cur_end = 0
+    byte_count = 0
+    while byte_count < len(buf):
+        byte_count += 1
+        if mem_count > min_count and buf[byte_count - len(terminator):byte_count] == terminator:
+            regions.append((cur_start, cur_end))
+            mem_count = 0
+            cur_start = cur_end + 1
+            cur_end = cur_start
+        else:
+            mem_count += 1
+            cur_end += 1
+            if cur_end == len(buf) - 1:
+                regions.append((cur_start, cur_end))
+                break
+    return regions or whole_buffer(buf)
+
+def whole_buffer(buf: bytes) -> List[Region]:
+    # aflnet treats a buffer it cannot split as a single request.
+    return [(0, len(buf) - 1)] if buf else []
+
+def split_line(buf: bytes) -> List[Region]:
+    return split_terminated(buf, b"\r\n", 1)
+
+def split_rtsp(buf: bytes) -> List[Region]:
+    return split_terminated(buf, b"\r\n\r\n", 3)
+
+def split_http(buf: bytes) -> List[Region]:
+    return split_terminated(buf, b"\r\n\r\n", 3)
+
+def split_sip(buf: bytes) -> List[Region]:
+    regions = []
+    mem_count = 0
+    cur_start = cur_end = 0
+    byte_count = 0
+    while byte_count < len(buf):
+        byte_count += 1
+        if mem_count > 1 and buf[byte_count - 2] == 0x0D and buf[byte_count:].startswith((b"REGISTER", b"INVITE", b"ACK", b"BYE")):
+            regions.append((cur_start, cur_end))
+            mem_count = 0
+            cur_start = cur_end + 1
+            cur_end = cur_start
+        else:
+            mem_count += 1
+            cur_end += 1
+            if cur_end == len(buf) - 1:
+                regions.append((cur_start, cur_end))
+                break
+    return regions or whole_buffer(buf)
+
+def split_ssh(buf: bytes) -> List[Region]:
+    regions = []
+    mem = bytearray()
+    cur_start = cur_end = 0
+    byte_count = 0
+    size = len(buf)
+    while byte_count < size:
+        mem.append(buf[byte_count])
+        byte_count += 1
+        if len(mem) > 6:
+            if mem.startswith(b"SSH-"):
+                while byte_count < size and mem[-2:] != b"\r\n":
+                    mem.append(buf[byte_count])
+                    byte_count += 1
+                    cur_end += 1
+            else:
+                message_size = struct.unpack_from(">I", mem)[0]
+                bytes_to_skip = (message_size - 2) & 0xFFFFFFFF
+                if not 20 <= mem[5] <= 49:
+                    bytes_to_skip = (bytes_to_skip + 8) & 0xFFFFFFFF
+                skipped = min(bytes_to_skip, size - byte_count)
+                byte_count += skipped
+                cur_end += skipped
+                if byte_count < size:
+                    byte_count -= 1
+                    cur_end -= 1
+            regions.append((cur_start, cur_end))
+            if cur_end < size - 1:
+                mem = bytearray()
+                cur_start = cur_end + 1
+                cur_end = cur_start
+        else:
+            cur_end += 1
+            if cur_end == size - 1:
+                regions.append((cur_start, cur_end))
+                break
+    return regions or whole_buffer(buf)
+
+def split_tls(buf: bytes) -> List[Region]:
+    regions = []
+    mem = bytearray()
+    cur_start = cur_end = 0
+    byte_count = 0
+    size = len(buf)
+    while byte_count < size:
+        mem.append(buf[byte_count])
+        byte_count += 1
+        if len(mem) > 5:
+            skipped = min(struct.unpack_from(">H", mem, 3)[0], size - byte_count)
+            byte_count += skipped
+            cur_end += skipped
+            if byte_count < size:
+                byte_count -= 1
+                cur_end -= 1
+            regions.append((cur_start, cur_end))
+            if cur_end < size - 1:
+                mem = bytearray()
+                cur_start = cur_end + 1
+                cur_end = cur_start
+        else:
+            cur_end += 1
+            if cur_end == size - 1:
+                regions.append((cur_start, cur_end))
+                break
+    return regions or whole_buffer(buf)
+
+def split_dtls12(buf: bytes) -> List[Region]:
+    regions = []
+    cur_start = 0
+    size = len(buf)
+    for byte_count in range(size):
+        if byte_count > 3 and size - byte_count > 1 and 0x14 <= buf[byte_count] <= 0x18 and buf[byte_count + 1:byte_count + 3] == b"\xfe\xfd":
+            regions.append((cur_start, byte_count - 1))
+            cur_start = byte_count
+        elif byte_count == size - 1:
+            regions.append((cur_start, byte_count))
+            break
+    return regions or whole_buffer(buf)
+
+def split_dicom(buf: bytes) -> List[Region]:
+    regions = []
+    size = len(buf)
+    byte_count = 0
+    while byte_count < size:
+        if byte_count + 5 >= size:
+            break
+        packet_length = struct.unpack_from(">I", buf, byte_count + 2)[0] + 6
+        end = byte_count + packet_length - 1
+        if end >= size:
+            break
+        regions.append((byte_count, end))
+        byte_count += packet_length
+    if byte_count < size:
+        regions.append((byte_count, size - 1))
+    return regions
+
+def split_dns(buf: bytes) -> List[Region]:
+    regions = []
+    mem_count = 0
+    cur_start = cur_end = 0
+    size = len(buf)
+    byte_count = 0
+    while byte_count < size:
+        # A DNS header is 12 bytes long and the first null byte after it ends
+        # the query name, followed by 4 bytes of type and class.
+        if mem_count >= 12 and buf[byte_count] == 0:
+            cur_end += 4
+            byte_count += 4
+            regions.append((cur_start, cur_end))
+            if cur_end == size - 1:
+                break
+            mem_count = 0
+            cur_start = cur_end + 1
+            cur_end = cur_start
+        else:
+            mem_count += 1
+            cur_end += 1
+            if cur_end == size - 1:
+                regions.append((cur_start, cur_end))
+                break
+        byte_count += 1
+    return regions or whole_buffer(buf)
+
+# --protocol value: (framer, aflnet splitter). DAAP runs on aflnet's HTTP splitter.
+PROTOCOLS: Dict[str, Tuple[Callable[[bytes, int], bytes], Callable[[bytes], List[Region]]]] = {
+    "FTP": (frame_line, split_line),
+    "SMTP": (frame_line, split_line),
+    "HTTP": (frame_header_block, split_http),
+    "DAAP": (frame_header_block, split_http),
+    "RTSP": (frame_header_block, split_rtsp),
+    "SIP": (frame_header_block, split_sip),
+    "SSH": (frame_ssh, split_ssh),
+    "TLS": (frame_tls, split_tls),
+    "DTLS12": (frame_dtls12, split_dtls12),
+    "DTLS": (frame_dtls12, split_dtls12),
+    "DICOM": (frame_dicom, split_dicom),
+    "DNS": (frame_raw, split_dns),
+}
+
+def frame_messages(protocol: Optional[str], messages: List[bytes]) -> List[bytes]:
+    """Frame the messages of one sequence for protocol. Unknown protocols keep
+    the old behavior of terminating every message with CRLF."""
+    framer = PROTOCOLS[protocol.upper()][0] if protocol and protocol.upper() in PROTOCOLS else frame_legacy
+    return [framer(message, index) for index, message in enumerate(messages)]
+
+def split_requests(protocol: str, buf: bytes) -> Optional[List[Region]]:
+    """Split a seed the way aflnet does for protocol, or None if there is no port of its splitter."""
+    if not protocol or protocol.upper() not in PROTOCOLS:
+        return None
+    return PROTOCOLS[protocol.upper()][1](buf)
+
+def message_regions(messages: List[bytes]) -> List[Region]:
+    """Regions of the non-empty messages in the seed made of messages."""
+    regions = []
+    offset = 0
+    for message in messages:
+        if message:
+            regions.append((offset, offset + len(message) - 1))
+        offset += len(message)
+    return regions
+
+def framing_matches(protocol: str, framed_messages: List[bytes]) -> Optional[bool]:
+    """True if aflnet splits the seed made of framed_messages back into exactly
+    those messages, None if the protocol has no splitter."""
+    regions = split_requests(protocol, b"".join(framed_messages))
+    if regions is None:
+        return None
+    return regions == message_regions(framed_messages)
+
+def to_replayable(framed_messages: List[bytes]) -> bytes:
+    """aflnet's replayable format, as in its replayable-queue: every message
+    preceded by its size as a 4-byte little endian integer."""
+    return b"".join(struct.pack("<I", len(message)) + message for message in framed_messages if message)
+
+def format_regions(framed_messages: List[bytes]) -> str:
+    """The regions of a seed in the format of aflnet's regions/ files."""
+    return "".join(f"Region {index} - Start: {start}, End: {end}\n" for index, (start, end) in enumerate(message_regions(framed_messages)))
@@ -1,10 +1,7 @@
-import os
-import json
-
-from typing import Optional, List
+from typing import List
 from pydantic import BaseModel
-from openai import OpenAI
-from utility.utility import MODEL, LLM_RETRY, LLM_RESULT_DIR, SEQUENCE_REPEAT
+from LLM.client import request_completion
+from utility.utility import LLM_RETRY
 
 STRUCTURED_SEED_MESSAGE_OUTPUT_DIR = "structured_seed_message_results"
 
@@ -62,27 +59,8 @@ Parse the following seed message according to the [PROTOCOL] specification, stri
 
 
 def using_llm(prompt: str) -> ParsedMessages:
-    client = OpenAI()
     try:
-        completion = client.beta.chat.completions.parse(
-            model=MODEL,
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant."},
-                {"role": "user", "content": prompt}
-            ],
-            response_format=ParsedMessages,
-            timeout=60
-        )   
-        response = completion.choices[0].message.parsed
-
-        index = 0
-        os.makedirs(os.path.join(LLM_RESULT_DIR, "5_structured_seed_message"), exist_ok=True)
-        while os.path.exists(os.path.join(LLM_RESULT_DIR, "5_structured_seed_message", f"response_{index}.json")):
-            index += 1
-        protocol_file = os.path.join(LLM_RESULT_DIR, "5_structured_seed_message", f"response_{index}.json")
-        with open(protocol_file, "w", encoding="utf-8") as f:
-            json.dump(completion.model_dump(), f, indent=4, ensure_ascii=False)
-        return response
+        return request_completion(prompt, ParsedMessages, "5_structured_seed_message", timeout=60)
     except Exception as e:
         print(f"Error processing protocol: {e}")
         return None
@@ -0,0 +1,115 @@
+import os
+import json
+import time
+import threading
+
+from contextlib import contextmanager
+from typing import Optional
+from utility.utility import write_atomically
+
+# Where the time of a run goes: every pipeline stage run by the scheduler
+# and every LLM request, by request stage (1_types, 6_testcases, ...) and
+# message type. write() saves the numbers as metrics.json and as a
+# Prometheus textfile for the node exporter's textfile collector.
+
+REQUEST_FIELDS = ("requests", "seconds", "max_seconds", "queue_wait_seconds", "prompt_tokens", "completion_tokens", "retries", "failures")
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.started = time.time()
+        self.stages = {}
+        self.requests = {}
+
+    @contextmanager
+    def message_type(self, name: str):
+        """Attribute the requests made by this thread in the block to message type name."""
+        previous = getattr(self.local, "message_type", "")
+        self.local.message_type = name
+        try:
+            yield
+        finally:
+            self.local.message_type = previous
+
+    def entry(self, stage: str, source: str = "api") -> dict:
+        key = (stage, getattr(self.local, "message_type", ""), source)
+        if key not in self.requests:
+            self.requests[key] = dict.fromkeys(REQUEST_FIELDS, 0)
+        return self.requests[key]
+
+    def record_stage(self, name: str, queue_wait: float, seconds: float, status: str) -> None:
+        with self.lock:
+            self.stages[name] = {"seconds": seconds, "queue_wait_seconds": queue_wait, "status": status}
+
+    def record_request(self, stage: str, source: str, seconds: float, prompt_tokens: int = 0, completion_tokens: int = 0, failed: bool = False) -> None:
+        with self.lock:
+            entry = self.entry(stage, source)
+            entry["requests"] += 1
+            entry["seconds"] += seconds
+            entry["max_seconds"] = max(entry["max_seconds"], seconds)
+            entry["prompt_tokens"] += prompt_tokens or 0
+            entry["completion_tokens"] += completion_tokens or 0
+            entry["failures"] += failed
+
+    def record_queue_wait(self, stage: str, seconds: float) -> None:
+        with self.lock:
+            self.entry(stage)["queue_wait_seconds"] += seconds
+
+    def record_retry(self, stage: str) -> None:
+        with self.lock:
+            self.entry(stage)["retries"] += 1
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            requests = [{"stage": stage, "type": message_type, "source": source, **entry}
+                        for (stage, message_type, source), entry in sorted(self.requests.items())]
+            stages = {name: dict(stage) for name, stage in self.stages.items()}
+        totals = {field: sum(entry[field] for entry in requests) for field in REQUEST_FIELDS if field != "max_seconds"}
+        return {"run_seconds": time.time() - self.started, "stages": stages, "requests": requests, "totals": totals}
+
+    def write(self, json_path: str, textfile_path: Optional[str] = None) -> dict:
+        report = self.snapshot()
+        write_atomically(json_path, json.dumps(report, indent=4).encode("utf-8"))
+        if textfile_path:
+            # The collector only reads *.prom files, so it never sees the temporary file.
+            os.makedirs(os.path.dirname(textfile_path) or ".", exist_ok=True)
+            write_atomically(textfile_path, prometheus_text(report).encode("utf-8"))
+        return report
+
+def label_value(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def format_labels(**labels) -> str:
+    return "{" + ",".join(f'{name}="{label_value(value)}"' for name, value in labels.items()) + "}"
+
+# Prometheus name, type, help, field of a request entry
+REQUEST_METRICS = [
+    ("stellafuzz_llm_requests_total", "counter", "LLM requests", "requests"),
+    ("stellafuzz_llm_request_seconds_total", "counter", "Time spent in LLM requests", "seconds"),
+    ("stellafuzz_llm_request_seconds_max", "gauge", "Slowest LLM request", "max_seconds"),
+    ("stellafuzz_llm_queue_wait_seconds_total", "counter", "Time LLM requests waited for the rate limiter", "queue_wait_seconds"),
+    ("stellafuzz_llm_prompt_tokens_total", "counter", "Prompt tokens reported by the API", "prompt_tokens"),
+    ("stellafuzz_llm_completion_tokens_total", "counter", "Completion tokens reported by the API", "completion_tokens"),
+    ("stellafuzz_llm_retries_total", "counter", "Retried LLM API calls", "retries"),
+    ("stellafuzz_llm_failures_total", "counter", "LLM requests without a usable response", "failures"),
+]
+
+def prometheus_text(report: dict) -> str:
+    lines = []
+    for name, metric_type, help_text, field in REQUEST_METRICS:
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}"]
+        for entry in report["requests"]:
+            labels = format_labels(stage=entry["stage"], type=entry["type"], source=entry["source"])
+            lines.append(f"{name}{labels} {entry[field]}")
+    lines += ["# HELP stellafuzz_stage_seconds Run time of a pipeline stage", "# TYPE stellafuzz_stage_seconds gauge"]
+    for stage, entry in sorted(report["stages"].items()):
+        lines.append(f"stellafuzz_stage_seconds{format_labels(stage=stage, status=entry['status'])} {entry['seconds']}")
+    lines += ["# HELP stellafuzz_stage_queue_wait_seconds Time a ready pipeline stage waited for a worker", "# TYPE stellafuzz_stage_queue_wait_seconds gauge"]
+    for stage, entry in sorted(report["stages"].items()):
+        lines.append(f"stellafuzz_stage_queue_wait_seconds{format_labels(stage=stage, status=entry['status'])} {entry['queue_wait_seconds']}")
+    lines += ["# HELP stellafuzz_run_seconds Run time of stellafuzz.py", "# TYPE stellafuzz_run_seconds gauge",
+              f"stellafuzz_run_seconds {report['run_seconds']}"]
+    return "\n".join(lines) + "\n"
+
+metrics = Metrics()
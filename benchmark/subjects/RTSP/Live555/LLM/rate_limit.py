@@ -0,0 +1,136 @@
+import re
+import time
+import random
+import threading
+
+from email.utils import parsedate_to_datetime
+from typing import Optional
+from utility.utility import LLM_RPM, LLM_TPM, LLM_BACKOFF_BASE, LLM_BACKOFF_MAX, LLM_CONCURRENCY
+
+class TokenBucket:
+    """Token bucket refilled continuously at `per_minute` tokens per minute.
+
+    A rate of 0 disables the bucket. Consumption may drive the bucket below
+    zero when a request turns out to be larger than estimated; later callers
+    then wait until the debt is paid back.
+    """
+
+    def __init__(self, per_minute: int):
+        self.capacity = per_minute
+        self.tokens = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount: float = 1) -> float:
+        """Block until `amount` tokens are available and take them. Returns the time waited."""
+        if self.capacity <= 0:
+            return 0.0
+        # A single request larger than the bucket would never fit; let it
+        # through once the bucket is full.
+        amount = min(amount, self.capacity)
+        start = time.monotonic()
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.refill(now)
+                if now >= self.paused_until and self.tokens >= amount:
+                    self.tokens -= amount
+                    return now - start
+                delay = max(self.paused_until - now, (amount - self.tokens) / self.rate)
+            time.sleep(min(delay, 1.0))
+
+    def consume(self, amount: float) -> None:
+        if self.capacity <= 0:
+            return
+        with self.lock:
+            self.refill(time.monotonic())
+            self.tokens -= amount
+
+    def pause(self, seconds: float) -> None:
+        """Hold back every caller for `seconds`, e.g. after the provider returned 429."""
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+class RateLimiter:
+    """Process-wide request and token budget shared by all LLM stages."""
+
+    def __init__(self, requests_per_minute: int = LLM_RPM, tokens_per_minute: int = LLM_TPM, max_in_flight: int = LLM_CONCURRENCY):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        # Stages run concurrently and each maps its calls over its own
+        # workers, so the number of requests in flight is capped here, once
+        # for the whole process.
+        self.in_flight = threading.BoundedSemaphore(max_in_flight)
+        self.lock = threading.Lock()
+        self.retries = {}
+
+    def limit_in_flight(self, max_in_flight: int) -> None:
+        """Allow at most max_in_flight concurrent requests; call before the first request."""
+        self.in_flight = threading.BoundedSemaphore(max(1, max_in_flight))
+
+    def acquire(self, estimated_tokens: int) -> float:
+        waited = self.requests.acquire(1)
+        waited += self.tokens.acquire(estimated_tokens)
+        return waited
+
+    def settle(self, estimated_tokens: int, used_tokens: int) -> None:
+        """Charge the difference between the estimate and the reported usage."""
+        self.tokens.consume(used_tokens - estimated_tokens)
+
+    def pause(self, seconds: float) -> None:
+        self.requests.pause(seconds)
+
+    def record_retry(self, stage: str) -> None:
+        with self.lock:
+            self.retries[stage] = self.retries.get(stage, 0) + 1
+
+limiter = RateLimiter()
+
+# Splits text roughly the way the pre-tokenizer of the GPT models does:
+# letters, numbers of up to three digits and punctuation each start a new
+# token, so the hex notation of binary messages ("0x1a 0x0b") is counted as
+# the 3-4 tokens per byte it really costs instead of about one.
+TOKEN_PIECE = re.compile(r" ?[A-Za-z]+| ?[0-9]{1,3}| ?[^\sA-Za-z0-9]+|\s+")
+
+def estimate_tokens(text: str) -> int:
+    """Local estimate of the number of tokens of text; long words count as
+    one token per eight characters."""
+    return sum(len(piece) // 8 + 1 for piece in TOKEN_PIECE.findall(text)) + 1
+
+def retry_after(error: Exception) -> Optional[float]:
+    """Seconds requested by the Retry-After headers of an API error, if any."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        if "retry-after" in headers:
+            value = headers["retry-after"]
+            try:
+                return float(value)
+            except ValueError:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        pass
+    return None
+
+def backoff_delay(attempt: int, error: Exception) -> float:
+    """Exponential backoff with jitter, unless the server said how long to wait."""
+    delay = retry_after(error)
+    if delay is not None:
+        return min(delay, LLM_BACKOFF_MAX)
+    delay = min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+def report_retries() -> None:
+    if limiter.retries:
+        retries = ", ".join(f"{stage}: {count}" for stage, count in sorted(limiter.retries.items()))
+        print(f"LLM retries per stage: {retries}")
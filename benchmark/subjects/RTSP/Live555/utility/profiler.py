@@ -0,0 +1,129 @@
+import os
+import sys
+import json
+import time
+import threading
+
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from typing import Optional
+
+# Pipeline stages run on the threads of the scheduler and of map_concurrently.
+# stage() labels the current thread with the stage it works for. While
+# --profile is active, a background thread samples the stacks of all labelled
+# threads and charges every sample to the stage of its thread twice: once by
+# wall time and once by the CPU time the thread used since the previous
+# sample. Time spent waiting for the API or the rate limiter only shows up in
+# the wall profile, local work (validation, JSON, seed encoding) in both.
+#
+# Profiles are written as folded stacks ("frame;frame;frame count"), which
+# flamegraph.pl and speedscope read directly.
+
+PROFILE_INTERVAL = 0.005            # Seconds between two samples
+MAX_DEPTH = 128                     # Frames kept per sample, counted from the innermost one
+
+thread_stages = {}
+
+def current_stage() -> Optional[str]:
+    return thread_stages.get(threading.get_ident())
+
+@contextmanager
+def stage(name: Optional[str]):
+    """Attribute the work of this thread in the block to stage name; None keeps the current label."""
+    if name is None:
+        yield
+        return
+    ident = threading.get_ident()
+    previous = thread_stages.get(ident)
+    thread_stages[ident] = name
+    try:
+        yield
+    finally:
+        if previous is None:
+            thread_stages.pop(ident, None)
+        else:
+            thread_stages[ident] = previous
+
+def frame_name(code) -> str:
+    file_name = os.path.join(os.path.basename(os.path.dirname(code.co_filename)), os.path.basename(code.co_filename))
+    return f"{code.co_name} ({file_name}:{code.co_firstlineno})".replace(";", ":")
+
+def folded_stack(frame) -> str:
+    names = []
+    while frame is not None and len(names) < MAX_DEPTH:
+        names.append(frame_name(frame.f_code))
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+def thread_cpu_time(ident: int) -> Optional[float]:
+    try:
+        return time.clock_gettime(time.pthread_getcpuclockid(ident))
+    except (AttributeError, OSError):
+        # No per-thread CPU clocks on this platform, or the thread has exited.
+        return None
+
+class SamplingProfiler:
+    def __init__(self, interval: float = PROFILE_INTERVAL):
+        self.interval = interval
+        self.wall = defaultdict(Counter)    # stage -> folded stack -> samples
+        self.cpu = defaultdict(Counter)     # stage -> folded stack -> CPU microseconds
+        self.cpu_times = {}
+        self.samples = 0
+        self.seconds = 0.0
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self) -> None:
+        self.started = time.monotonic()
+        self.thread = threading.Thread(target=self.sample_loop, name="stellafuzz-profiler", daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        if self.thread is None:
+            return
+        self.stopped.set()
+        self.thread.join()
+        self.thread = None
+        self.seconds = time.monotonic() - self.started
+
+    def sample_loop(self) -> None:
+        while not self.stopped.wait(self.interval):
+            self.sample()
+
+    def sample(self) -> None:
+        frames = sys._current_frames()
+        self.samples += 1
+        for ident, name in list(thread_stages.items()):
+            frame = frames.get(ident)
+            if frame is None:
+                continue
+            stack = folded_stack(frame)
+            self.wall[name][stack] += 1
+            cpu_time = thread_cpu_time(ident)
+            if cpu_time is None:
+                continue
+            used = cpu_time - self.cpu_times.get(ident, cpu_time)
+            self.cpu_times[ident] = cpu_time
+            if used > 0:
+                self.cpu[name][stack] += int(used * 1e6)
+
+    def summary(self) -> dict:
+        stages = {}
+        for name in sorted(self.wall):
+            samples = sum(self.wall[name].values())
+            stages[name] = {"samples": samples, "thread_seconds": samples * self.interval,
+                            "cpu_seconds": sum(self.cpu[name].values()) / 1e6}
+        return {"interval": self.interval, "seconds": self.seconds, "samples": self.samples, "stages": stages}
+
+    def write(self, profile_dir: str) -> dict:
+        """Write <stage>.wall.folded, <stage>.cpu.folded and summary.json to profile_dir."""
+        os.makedirs(profile_dir, exist_ok=True)
+        for profiles, kind in ((self.wall, "wall"), (self.cpu, "cpu")):
+            for name, stacks in profiles.items():
+                with open(os.path.join(profile_dir, f"{name}.{kind}.folded"), "w") as f:
+                    for stack, count in sorted(stacks.items()):
+                        f.write(f"{stack} {count}\n")
+        summary = self.summary()
+        with open(os.path.join(profile_dir, "summary.json"), "w") as f:
+            json.dump(summary, f, indent=4)
+        return summary
@@ -0,0 +1,177 @@
+import os
+import time
+import threading
+
+from typing import TYPE_CHECKING, Any, Callable, Optional, Tuple, Type
+from pydantic import BaseModel
+from utility.utility import MODEL, LLM_RESULT_DIR, LLM_MAX_CONNECTIONS, LLM_KEEPALIVE_EXPIRY, LLM_API_RETRY, LLM_MAX_PROMPT_TOKENS
+from utility.artifacts import append_artifact
+from LLM.rate_limit import limiter, estimate_tokens, backoff_delay
+import LLM.cache as llm_cache
+import LLM.cassette as llm_cassette
+from utility.metrics import metrics
+
+# openai and httpx take a large part of the startup time, so they are only
+# imported once a request actually goes to the API; --help, replayed and
+# fully cached runs never load them.
+if TYPE_CHECKING:
+    import httpx
+    from openai import OpenAI
+
+shared_client: Optional["OpenAI"] = None
+client_lock = threading.Lock()
+connection_stats = {"requests": 0, "connections": 0}
+
+def count_connection(event_name: str, info: dict) -> None:
+    if event_name == "connection.connect_tcp.complete":
+        with client_lock:
+            connection_stats["connections"] += 1
+
+def trace_request(request: "httpx.Request") -> None:
+    with client_lock:
+        connection_stats["requests"] += 1
+    request.extensions["trace"] = count_connection
+
+def get_client() -> "OpenAI":
+    """Return the process-wide OpenAI client.
+
+    All stages and worker threads share one client, so its connection pool
+    keeps TLS connections to the API alive between requests instead of
+    setting up a new client and connection for every call.
+    """
+    global shared_client
+    with client_lock:
+        if shared_client is None:
+            import httpx
+            from openai import OpenAI
+            http_client = httpx.Client(
+                limits=httpx.Limits(
+                    max_connections=LLM_MAX_CONNECTIONS,
+                    max_keepalive_connections=LLM_MAX_CONNECTIONS,
+                    keepalive_expiry=LLM_KEEPALIVE_EXPIRY
+                ),
+                event_hooks={"request": [trace_request]}
+            )
+            # Retries are handled by request_completion so that every attempt
+            # goes through the rate limiter.
+            shared_client = OpenAI(http_client=http_client, max_retries=0)
+        return shared_client
+
+def report_connections() -> None:
+    requests = connection_stats["requests"]
+    if requests == 0:
+        return
+    connections = connection_stats["connections"]
+    reuse_rate = 100 * (requests - connections) / requests
+    print(f"LLM connections: {requests} requests over {connections} connections ({reuse_rate:.1f}% reused)")
+
+def call_api(stage: str, call: Callable[[], Any], estimated_tokens: int = 0) -> Any:
+    """Run an API call, retrying transient errors with backoff.
+
+    Every attempt goes through the shared rate limiter and holds one of its
+    in-flight slots until the response is there; the backoff delay between
+    attempts does not. The LLM_RETRY loops of the stages only retry unusable
+    answers.
+    """
+    # APIConnectionError also covers timeouts.
+    from openai import RateLimitError, APIConnectionError, InternalServerError
+    for attempt in range(LLM_API_RETRY + 1):
+        started = time.monotonic()
+        with limiter.in_flight:
+            waited = time.monotonic() - started
+            metrics.record_queue_wait(stage, waited + limiter.acquire(estimated_tokens))
+            try:
+                return call()
+            except (RateLimitError, APIConnectionError, InternalServerError) as error:
+                if attempt == LLM_API_RETRY:
+                    raise
+                e = error
+        delay = backoff_delay(attempt, e)
+        if isinstance(e, RateLimitError):
+            limiter.pause(delay)
+        limiter.record_retry(stage)
+        metrics.record_retry(stage)
+        print(f"Retrying {stage} request in {delay:.1f}s: {e}")
+        time.sleep(delay)
+
+def save_completion(stage: str, completion: dict, key: str) -> None:
+    """Append a raw completion to llm_outputs/<stage>/responses.jsonl.
+
+    The request key is stored with it as "request_key", so that a replay from
+    llm_outputs can give every request its own response; completions are
+    appended in the order they finish, not in the order they were requested.
+    """
+    append_artifact(os.path.join(LLM_RESULT_DIR, stage, "responses.jsonl"), dict(completion, request_key=key))
+
+def log_prompt_size(stage: str, prompt: str, estimated_tokens: int, prompt_tokens: Optional[int] = None) -> None:
+    used = "" if prompt_tokens is None else f", {prompt_tokens} billed"
+    print(f"{stage} prompt: {len(prompt)} characters, ~{estimated_tokens} tokens estimated{used}")
+
+def request_completion(prompt: str, response_format: Type[BaseModel], stage: str, temperature: Optional[float] = None, timeout: float = 90) -> Optional[BaseModel]:
+    """Send prompt to the model and return the parsed response.
+
+    The raw completion is appended to llm_outputs/<stage>/responses.jsonl.
+    When the response cache is enabled, a prompt that was already answered is
+    served from the cache without contacting the model. In replay mode every
+    response comes from the cassette and the network is never used. Time,
+    tokens and failures of every request are recorded in utility.metrics.
+    """
+    cassette = llm_cassette.cassette
+    started = time.monotonic()
+    try:
+        response, source, usage = complete(prompt, response_format, stage, temperature, timeout)
+    except Exception:
+        source = "replay" if cassette is not None and cassette.mode == "replay" else "api"
+        metrics.record_request(stage, source, time.monotonic() - started, failed=True)
+        raise
+    metrics.record_request(stage, source, time.monotonic() - started,
+                           usage.prompt_tokens if usage is not None else 0,
+                           usage.completion_tokens if usage is not None else 0,
+                           failed=response is None)
+    return response
+
+def complete(prompt: str, response_format: Type[BaseModel], stage: str, temperature: Optional[float], timeout: float) -> Tuple[Optional[BaseModel], str, Any]:
+    """Returns the response, where it came from (api, cache or replay) and the token usage."""
+    key = llm_cache.request_key(MODEL, temperature, prompt, response_format)
+    cassette = llm_cassette.cassette
+    if cassette is not None and cassette.mode == "replay":
+        return cassette.replay(stage, key, response_format), "replay", None
+
+    cache = llm_cache.cache
+    if cache is not None:
+        response = cache.get(key, response_format)
+        if response is not None:
+            if cassette is not None:
+                cassette.record(stage, key, response)
+            return response, "cache", None
+
+    options = {} if temperature is None else {"temperature": temperature}
+    client = get_client()
+    estimated_tokens = estimate_tokens(prompt)
+    if estimated_tokens > LLM_MAX_PROMPT_TOKENS:
+        print(f"Warning: {stage} prompt of ~{estimated_tokens} tokens exceeds {LLM_MAX_PROMPT_TOKENS} tokens")
+    completion = call_api(stage, lambda: client.beta.chat.completions.parse(
+        model=MODEL,
+        messages=[
+            {"role": "system", "content": "You are a helpful assistant."},
+            {"role": "user", "content": prompt}
+        ],
+        response_format=response_format,
+        timeout=timeout,
+        **options
+    ), estimated_tokens)
+
+    prompt_tokens = None
+    if completion.usage is not None:
+        limiter.settle(estimated_tokens, completion.usage.total_tokens)
+        prompt_tokens = completion.usage.prompt_tokens
+    log_prompt_size(stage, prompt, estimated_tokens, prompt_tokens)
+    response = completion.choices[0].message.parsed
+    save_completion(stage, completion.model_dump(), key)
+
+    if response is not None:
+        if cache is not None:
+            cache.put(key, response)
+        if cassette is not None:
+            cassette.record(stage, key, response)
+    return response, "api", completion.usage
@@ -0,0 +1,101 @@
+import re
+
+from typing import Optional
+
+# Seeds are shown to the LLM, and come back from it, as text in which every
+# byte that is not printable ASCII, a tab or a newline is written as " 0xHH ".
+#
+# encode() and decode() are exact inverses: decode(encode(data)) == data for
+# any bytes. Only a run of escapes that starts and ends at whitespace or at
+# the start or end of the text is decoded, so that "0x" inside a word, as in
+# "STOR 0xfile" or "X-Id: 0xdeadbeef", stays text. A run takes at most one
+# padding space on each side with it when it is decoded, and a literal "0"
+# that would otherwise start an escape (a "0" followed by "x" and a hex
+# digit) is encoded as an escape itself. decode() also accepts the LLM's
+# notation, "0x1a 0x0b", runs without padding such as "0x000x01", and
+# single-digit escapes such as "0x1" that stand on their own.
+
+def is_readable_byte(byte: int) -> bool:
+    return byte in (9, 10, 13) or (32 <= byte <= 126)
+
+READABLE_BYTES = bytes(byte for byte in range(256) if is_readable_byte(byte))
+ESCAPE_TABLE = [chr(byte) if is_readable_byte(byte) else f" 0x{byte:02x} " for byte in range(256)]
+LITERAL_ZERO = re.compile(rb"0(?=x[0-9a-fA-F])")
+ESCAPED_ZERO = " 0x30 "
+
+# A run of escapes with its padding. Escapes in a run are separated by the
+# two spaces of their padding, the single space of the LLM's notation or
+# nothing; the run itself is the only group, so that ESCAPE_RUN.split()
+# alternates between literal text and runs.
+ESCAPE_RUN = re.compile(rb"(?: (?=0x)|(?<!\S)(?=0x))((?:0x[0-9a-fA-F]{2}(?:  ?(?=0x))?)*0x[0-9a-fA-F]{2}|0x[0-9a-fA-F])(?: |(?!\S))")
+HEX_DIGITS = "0123456789abcdefABCDEF"
+SINGLE_ESCAPES = {f"0x{high}{low}".encode("ascii"): bytes([int(high + low, 16)]) for high in HEX_DIGITS for low in HEX_DIGITS}    # Runs of one escape, the most common ones
+HEX_ONLY = re.compile(rb"[ 0-9a-fA-Fx]+")
+DECODE_CHUNK = 1 << 20              # Bytes of text decoded at once, see decode()
+
+def encode_part(data: bytes) -> str:
+    if not data.translate(None, READABLE_BYTES):
+        return data.decode("ascii")
+    return "".join(map(ESCAPE_TABLE.__getitem__, data))
+
+def encode(data: bytes) -> str:
+    """Convert bytes into the readable 0xHH notation."""
+    return ESCAPED_ZERO.join(map(encode_part, LITERAL_ZERO.split(data)))
+
+def decode_hex_only(data: bytes) -> Optional[bytes]:
+    """Fast path for text made of nothing but two-digit escapes, the usual
+    shape of binary messages written by the LLM. Returns None for any other
+    text, which is decoded escape by escape."""
+    body = data.lower()
+    if body[:1] == b" ":
+        body = body[1:]
+    if body[-1:] == b" ":
+        body = body[:-1]
+    try:
+        result = bytes.fromhex(body.replace(b"0x", b"").decode("ascii"))
+    except ValueError:
+        return None
+    if not result:
+        return None
+    # Only accept the text if it is exactly how these bytes are written.
+    separator = "  0x" if b"  " in body else " 0x"
+    if ("0x" + result.hex(" ").replace(" ", separator)).encode("ascii") != body:
+        return None
+    return result
+
+def decode(text: str) -> bytes:
+    """Convert text in the 0xHH notation back into bytes; text outside of
+    escapes is encoded as UTF-8."""
+    data = text.encode("utf-8")
+    if b"0x" not in data:
+        return data
+    if HEX_ONLY.fullmatch(data):
+        result = decode_hex_only(data)
+        if result is not None:
+            return result
+    if len(data) <= DECODE_CHUNK:
+        return decode_escapes(data)
+    # ESCAPE_RUN.split() keeps an object per run, several gigabytes for a
+    # 100 MB seed. Large texts are decoded in pieces that end at a newline,
+    # which no escape contains, so the pieces decode exactly like the whole.
+    pieces = []
+    start = 0
+    while start < len(data):
+        end = data.find(b"\n", start + DECODE_CHUNK) + 1 or len(data)
+        pieces.append(decode_escapes(data[start:end]))
+        start = end
+    return b"".join(pieces)
+
+def decode_run(run: bytes) -> bytes:
+    single = SINGLE_ESCAPES.get(run)
+    if single is not None:
+        return single
+    digits = run.replace(b" ", b"").replace(b"0x", b"")
+    if len(digits) == 1:
+        digits = b"0" + digits
+    return bytes.fromhex(digits.decode("ascii"))
+
+def decode_escapes(data: bytes) -> bytes:
+    parts = ESCAPE_RUN.split(data)
+    parts[1::2] = map(decode_run, parts[1::2])
+    return b"".join(parts)